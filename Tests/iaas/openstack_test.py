@@ -7,147 +7,186 @@
 SPDX-License-Identifier: CC-BY-SA 4.0
 """
 
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextlib
+import contextvars
+import fcntl
 import getopt
+import hashlib
+import io
+import json
 import logging
 import os
+import os.path
+import signal
+import socketserver
 import sys
+import threading
+import time
 
-import openstack
-
-from scs_0100_flavor_naming.flavor_names import compute_flavor_spec
-from scs_0100_flavor_naming.flavor_names_check import \
-    compute_scs_flavors, compute_scs_0100_syntax_check, compute_scs_0100_semantics_check
-from scs_0101_entropy.entropy_check import \
-    compute_canonical_image, compute_collected_vm_output, compute_scs_0101_entropy_avail, \
-    compute_scs_0101_fips_test
-from scs_0102_image_metadata.image_metadata import \
-    compute_scs_0102_prop_architecture, compute_scs_0102_prop_hash_algo, compute_scs_0102_prop_min_disk, \
-    compute_scs_0102_prop_min_ram, compute_scs_0102_prop_os_version, compute_scs_0102_prop_os_distro, \
-    compute_scs_0102_prop_os_purpose, \
-    compute_scs_0102_prop_hw_disk_bus, compute_scs_0102_prop_hypervisor_type, compute_scs_0102_prop_hw_rng_model, \
-    compute_scs_0102_prop_image_build_date, compute_scs_0102_prop_image_original_user, \
-    compute_scs_0102_prop_image_source, compute_scs_0102_prop_image_description, \
-    compute_scs_0102_prop_replace_frequency, compute_scs_0102_prop_provided_until, \
-    compute_scs_0102_prop_uuid_validity, compute_scs_0102_prop_hotfix_hours, \
-    compute_scs_0102_image_recency, compute_scs_0102_os_purpose_uniqueness
-from scs_0103_standard_flavors.standard_flavors import \
-    SCS_0103_CANONICAL_NAMES, compute_flavor_lookup, compute_scs_0103_flavor
-from scs_0104_standard_images.standard_images import \
-    SCS_0104_IMAGE_SPECS, compute_scs_0104_source, compute_scs_0104_image
-from scs_0114_volume_types.volume_types import \
-    compute_volume_type_lookup, compute_scs_0114_syntax_check, compute_scs_0114_aspect_type
-from scs_0115_security_groups.security_groups import \
-    compute_scs_0115_default_rules
-from scs_0116_key_manager.key_manager import \
-    ensure_unprivileged, compute_services_lookup, compute_scs_0116_presence, compute_scs_0116_permissions
-from scs_0117_volume_backup.volume_backup import \
-    compute_scs_0117_test_backup
-from scs_0123_mandatory_services.mandatory_services import \
-    compute_scs_0123_service_presence, compute_scs_0123_swift_s3
+
+class _LazyModule:
+    """Stand-in for the module `name` that imports the latter on first attribute access"""
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        # use the machinery of the import statement rather than importlib, so `python -X importtime` sees it
+        __import__(self._name)
+        return getattr(sys.modules[self._name], attr)
+
+
+# the SDK as well as the testcase modules are imported only when first used, so a run (or a request
+# to the daemon) for a few testcases needn't pay for the others; see `openstack_test_test.py`
+openstack = _LazyModule('openstack')
+flavor_names = _LazyModule('scs_0100_flavor_naming.flavor_names')
+flavor_names_check = _LazyModule('scs_0100_flavor_naming.flavor_names_check')
+entropy_check = _LazyModule('scs_0101_entropy.entropy_check')
+image_metadata = _LazyModule('scs_0102_image_metadata.image_metadata')
+standard_flavors = _LazyModule('scs_0103_standard_flavors.standard_flavors')
+standard_images = _LazyModule('scs_0104_standard_images.standard_images')
+volume_types = _LazyModule('scs_0114_volume_types.volume_types')
+security_groups = _LazyModule('scs_0115_security_groups.security_groups')
+key_manager = _LazyModule('scs_0116_key_manager.key_manager')
+volume_backup = _LazyModule('scs_0117_volume_backup.volume_backup')
+mandatory_services = _LazyModule('scs_0123_mandatory_services.mandatory_services')
 
 
 logger = logging.getLogger(__name__)
 
+# default number of testcases to evaluate concurrently; mind that some testcases create resources
+# (servers, volumes, backups), so evaluating them concurrently takes more quota at the same time
+DEFAULT_JOBS = 1
+# default number of seconds that the daemon (see `serve`) keeps listings of a cloud
+LISTING_TTL = 300
+# values that the daemon keeps per cloud across requests (all but `conn` for no longer than the TTL)
+SHARED_KEYS = (
+    'conn', 'flavors', 'images', 'image_lookup', 'volume_types', 'services_lookup',
+    'flavors_fingerprint', 'images_fingerprint', 'volume_types_fingerprint',
+)
+
 
-def usage(rcode=1, file=sys.stderr):
+def usage(rcode=1, file=None):
     """help output"""
+    file = file or sys.stderr
     print("Usage: openstack_test.py [options] testcase-id1 ... testcase-idN", file=file)
+    print("       openstack_test.py --serve SOCKET [--ttl SECONDS]", file=file)
     print("Options: [-c/--os-cloud OS_CLOUD] sets cloud environment (default from OS_CLOUD env)", file=file)
+    print(f"         [-j/--jobs N] evaluate up to N testcases concurrently (default: {DEFAULT_JOBS})", file=file)
+    print("         [--plan] only print the values needed for the testcases and the estimated number of API calls", file=file)
+    print("         [--debug-timing] print time spent computing each value and number of accesses to stderr", file=file)
+    print("         [--cache FILE] reuse verdicts of read-only testcases from FILE if the cloud is unchanged", file=file)
     print("Runs specified testcases against the OpenStack cloud OS_CLOUD", file=file)
     print("and reports inconsistencies, errors etc. It returns 0 on success.", file=file)
+    print("With --serve, runs as daemon that accepts requests at the unix socket SOCKET (see", file=file)
+    print("option --dispatch of scs-compliance-check.py) and keeps connections as well as listings", file=file)
+    print(f"per cloud for SECONDS seconds (default: {LISTING_TTL}).", file=file)
     sys.exit(rcode)
 
 
+def connect(cloud):
+    # disable verbose library logging (here rather than in `main`, so the SDK is imported only if need be)
+    openstack.enable_logging(debug=False)
+    return openstack.connect(cloud=cloud, timeout=32)
+
+
 def make_container(cloud):
+    # NOTE `deps` must list the values that each function accesses (this is checked by openstack_test_test.py);
+    # `api_calls` gives the number of API calls made by the function itself (rough estimate, without polling)
     c = Container()
     # basic support attributes shared by multiple testcases
-    c.add_function('conn', lambda _: openstack.connect(cloud=cloud, timeout=32))
-    c.add_function('flavors', lambda c: list(c.conn.list_flavors(get_extra=True)))
-    c.add_function('images', lambda c: [img for img in c.conn.list_images(show_all=True) if img.visibility in ('public', 'community')])
-    c.add_function('image_lookup', lambda c: {img.name: img for img in c.images})
+    c.add_function('conn', lambda _: connect(cloud), api_calls=1)
+    c.add_function('flavors', lambda c: list(c.conn.list_flavors(get_extra=True)), deps=('conn', ), api_calls=1)
+    c.add_function('images', lambda c: [img for img in c.conn.list_images(show_all=True) if img.visibility in ('public', 'community')], deps=('conn', ), api_calls=1)
+    c.add_function('image_lookup', lambda c: {img.name: img for img in c.images}, deps=('images', ))
+    # fingerprints of the listings, used by `ResultCache`
+    c.add_function('flavors_fingerprint', lambda c: compute_fingerprint(c.flavors), deps=('flavors', ))
+    c.add_function('images_fingerprint', lambda c: compute_fingerprint(c.images), deps=('images', ))
+    c.add_function('volume_types_fingerprint', lambda c: compute_fingerprint(c.volume_types), deps=('volume_types', ))
     # scs_0100_flavor_naming
-    c.add_function('scs_flavors', lambda c: compute_scs_flavors(c.flavors))
-    c.add_function('scs_0100_syntax_check', lambda c: compute_scs_0100_syntax_check(c.scs_flavors))
-    c.add_function('scs_0100_semantics_check', lambda c: compute_scs_0100_semantics_check(c.scs_flavors))
+    c.add_function('scs_flavors', lambda c: flavor_names_check.compute_scs_flavors(c.flavors), deps=('flavors', ))
+    c.add_function('scs_0100_syntax_check', lambda c: flavor_names_check.compute_scs_0100_syntax_check(c.scs_flavors), deps=('scs_flavors', ))
+    c.add_function('scs_0100_semantics_check', lambda c: flavor_names_check.compute_scs_0100_semantics_check(c.scs_flavors), deps=('scs_flavors', ))
     # scs_0101_entropy
-    c.add_function('canonical_image', lambda c: compute_canonical_image(c.images))
-    c.add_function('collected_vm_output', lambda c: compute_collected_vm_output(c.conn, c.flavors, c.canonical_image))
-    c.add_function('scs_0101_entropy_avail', lambda c: compute_scs_0101_entropy_avail(c.collected_vm_output, c.canonical_image.name))
-    c.add_function('scs_0101_fips_test', lambda c: compute_scs_0101_fips_test(c.collected_vm_output, c.canonical_image.name))
+    c.add_function('canonical_image', lambda c: entropy_check.compute_canonical_image(c.images), deps=('images', ))
+    c.add_function('collected_vm_output', lambda c: entropy_check.compute_collected_vm_output(c.conn, c.flavors, c.canonical_image), deps=('conn', 'flavors', 'canonical_image'), api_calls=14)
+    c.add_function('scs_0101_entropy_avail', lambda c: entropy_check.compute_scs_0101_entropy_avail(c.collected_vm_output, c.canonical_image.name), deps=('collected_vm_output', 'canonical_image'))
+    c.add_function('scs_0101_fips_test', lambda c: entropy_check.compute_scs_0101_fips_test(c.collected_vm_output, c.canonical_image.name), deps=('collected_vm_output', 'canonical_image'))
     # scs_0102_image_metadata
-    c.add_function('scs_0102_prop_architecture', lambda c: compute_scs_0102_prop_architecture(c.images))
-    c.add_function('scs_0102_prop_hash_algo', lambda c: compute_scs_0102_prop_hash_algo(c.images))
-    c.add_function('scs_0102_prop_min_disk', lambda c: compute_scs_0102_prop_min_disk(c.images))
-    c.add_function('scs_0102_prop_min_ram', lambda c: compute_scs_0102_prop_min_ram(c.images))
-    c.add_function('scs_0102_prop_os_version', lambda c: compute_scs_0102_prop_os_version(c.images))
-    c.add_function('scs_0102_prop_os_distro', lambda c: compute_scs_0102_prop_os_distro(c.images))
-    c.add_function('scs_0102_prop_os_purpose', lambda c: compute_scs_0102_prop_os_purpose(c.images))
-    c.add_function('scs_0102_prop_hw_disk_bus', lambda c: compute_scs_0102_prop_hw_disk_bus(c.images))
-    c.add_function('scs_0102_prop_hypervisor_type', lambda c: compute_scs_0102_prop_hypervisor_type(c.images))
-    c.add_function('scs_0102_prop_hw_rng_model', lambda c: compute_scs_0102_prop_hw_rng_model(c.images))
-    c.add_function('scs_0102_prop_image_build_date', lambda c: compute_scs_0102_prop_image_build_date(c.images))
-    c.add_function('scs_0102_prop_image_original_user', lambda c: compute_scs_0102_prop_image_original_user(c.images))
-    c.add_function('scs_0102_prop_image_source', lambda c: compute_scs_0102_prop_image_source(c.images))
-    c.add_function('scs_0102_prop_image_description', lambda c: compute_scs_0102_prop_image_description(c.images))
-    c.add_function('scs_0102_prop_replace_frequency', lambda c: compute_scs_0102_prop_replace_frequency(c.images))
-    c.add_function('scs_0102_prop_provided_until', lambda c: compute_scs_0102_prop_provided_until(c.images))
-    c.add_function('scs_0102_prop_uuid_validity', lambda c: compute_scs_0102_prop_uuid_validity(c.images))
-    c.add_function('scs_0102_prop_hotfix_hours', lambda c: compute_scs_0102_prop_hotfix_hours(c.images))
-    c.add_function('scs_0102_image_recency', lambda c: compute_scs_0102_image_recency(c.images))
-    c.add_function('scs_0102_os_purpose_uniqueness', lambda c: compute_scs_0102_os_purpose_uniqueness(c.images))
+    c.add_function('scs_0102_prop_architecture', lambda c: image_metadata.compute_scs_0102_prop_architecture(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_hash_algo', lambda c: image_metadata.compute_scs_0102_prop_hash_algo(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_min_disk', lambda c: image_metadata.compute_scs_0102_prop_min_disk(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_min_ram', lambda c: image_metadata.compute_scs_0102_prop_min_ram(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_os_version', lambda c: image_metadata.compute_scs_0102_prop_os_version(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_os_distro', lambda c: image_metadata.compute_scs_0102_prop_os_distro(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_os_purpose', lambda c: image_metadata.compute_scs_0102_prop_os_purpose(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_hw_disk_bus', lambda c: image_metadata.compute_scs_0102_prop_hw_disk_bus(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_hypervisor_type', lambda c: image_metadata.compute_scs_0102_prop_hypervisor_type(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_hw_rng_model', lambda c: image_metadata.compute_scs_0102_prop_hw_rng_model(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_image_build_date', lambda c: image_metadata.compute_scs_0102_prop_image_build_date(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_image_original_user', lambda c: image_metadata.compute_scs_0102_prop_image_original_user(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_image_source', lambda c: image_metadata.compute_scs_0102_prop_image_source(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_image_description', lambda c: image_metadata.compute_scs_0102_prop_image_description(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_replace_frequency', lambda c: image_metadata.compute_scs_0102_prop_replace_frequency(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_provided_until', lambda c: image_metadata.compute_scs_0102_prop_provided_until(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_uuid_validity', lambda c: image_metadata.compute_scs_0102_prop_uuid_validity(c.images), deps=('images', ))
+    c.add_function('scs_0102_prop_hotfix_hours', lambda c: image_metadata.compute_scs_0102_prop_hotfix_hours(c.images), deps=('images', ))
+    c.add_function('scs_0102_image_recency', lambda c: image_metadata.compute_scs_0102_image_recency(c.images), deps=('images', ))
+    c.add_function('scs_0102_os_purpose_uniqueness', lambda c: image_metadata.compute_scs_0102_os_purpose_uniqueness(c.images), deps=('images', ))
     # scs_0103_standard_flavors
-    c.add_function('flavor_lookup', lambda c: compute_flavor_lookup(c.flavors))
-    for canonical_name in SCS_0103_CANONICAL_NAMES:
+    c.add_function('flavor_lookup', lambda c: standard_flavors.compute_flavor_lookup(c.flavors), deps=('flavors', ))
+    for canonical_name in standard_flavors.SCS_0103_CANONICAL_NAMES:
         nm = canonical_name.removeprefix('SCS-').lower().replace('-', '_')
         # NOTE we need cn=canonical_name below because anon function only catches a variable's CELL, not its value
         # i.e., if we use canonical_name inside it, we will only get its final value after the loop is done
         c.add_function(
             f'scs_0103_flavor_{nm}',
-            lambda c, cn=canonical_name: compute_scs_0103_flavor(c.flavor_lookup, compute_flavor_spec(cn))
+            lambda c, cn=canonical_name: standard_flavors.compute_scs_0103_flavor(c.flavor_lookup, flavor_names.compute_flavor_spec(cn)),
+            deps=('flavor_lookup', ),
         )
     # scs_0104_standard_images
-    c.add_function('scs_0104_source_capi_1', lambda c: compute_scs_0104_source(c.image_lookup, SCS_0104_IMAGE_SPECS['ubuntu-capi-image-1']))
-    c.add_function('scs_0104_source_capi_2', lambda c: compute_scs_0104_source(c.image_lookup, SCS_0104_IMAGE_SPECS['ubuntu-capi-image-2']))
-    c.add_function('scs_0104_source_ubuntu_2404', lambda c: compute_scs_0104_source(c.image_lookup, SCS_0104_IMAGE_SPECS['Ubuntu 24.04']))
-    c.add_function('scs_0104_source_ubuntu_2204', lambda c: compute_scs_0104_source(c.image_lookup, SCS_0104_IMAGE_SPECS['Ubuntu 22.04']))
-    c.add_function('scs_0104_source_ubuntu_2004', lambda c: compute_scs_0104_source(c.image_lookup, SCS_0104_IMAGE_SPECS['Ubuntu 20.04']))
-    c.add_function('scs_0104_source_debian_13', lambda c: compute_scs_0104_source(c.image_lookup, SCS_0104_IMAGE_SPECS['Debian 13']))
-    c.add_function('scs_0104_source_debian_12', lambda c: compute_scs_0104_source(c.image_lookup, SCS_0104_IMAGE_SPECS['Debian 12']))
-    c.add_function('scs_0104_source_debian_11', lambda c: compute_scs_0104_source(c.image_lookup, SCS_0104_IMAGE_SPECS['Debian 11']))
-    c.add_function('scs_0104_source_debian_10', lambda c: compute_scs_0104_source(c.image_lookup, SCS_0104_IMAGE_SPECS['Debian 10']))
-    c.add_function('scs_0104_image_capi_1', lambda c: compute_scs_0104_image(c.image_lookup, SCS_0104_IMAGE_SPECS['ubuntu-capi-image-1']))
-    c.add_function('scs_0104_image_capi_2', lambda c: compute_scs_0104_image(c.image_lookup, SCS_0104_IMAGE_SPECS['ubuntu-capi-image-2']))
-    c.add_function('scs_0104_image_ubuntu_2404', lambda c: compute_scs_0104_image(c.image_lookup, SCS_0104_IMAGE_SPECS['Ubuntu 24.04']))
-    c.add_function('scs_0104_image_ubuntu_2204', lambda c: compute_scs_0104_image(c.image_lookup, SCS_0104_IMAGE_SPECS['Ubuntu 22.04']))
-    c.add_function('scs_0104_image_ubuntu_2004', lambda c: compute_scs_0104_image(c.image_lookup, SCS_0104_IMAGE_SPECS['Ubuntu 20.04']))
-    c.add_function('scs_0104_image_debian_13', lambda c: compute_scs_0104_image(c.image_lookup, SCS_0104_IMAGE_SPECS['Debian 13']))
-    c.add_function('scs_0104_image_debian_12', lambda c: compute_scs_0104_image(c.image_lookup, SCS_0104_IMAGE_SPECS['Debian 12']))
-    c.add_function('scs_0104_image_debian_11', lambda c: compute_scs_0104_image(c.image_lookup, SCS_0104_IMAGE_SPECS['Debian 11']))
-    c.add_function('scs_0104_image_debian_10', lambda c: compute_scs_0104_image(c.image_lookup, SCS_0104_IMAGE_SPECS['Debian 10']))
+    c.add_function('scs_0104_source_capi_1', lambda c: standard_images.compute_scs_0104_source(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['ubuntu-capi-image-1']), deps=('image_lookup', ))
+    c.add_function('scs_0104_source_capi_2', lambda c: standard_images.compute_scs_0104_source(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['ubuntu-capi-image-2']), deps=('image_lookup', ))
+    c.add_function('scs_0104_source_ubuntu_2404', lambda c: standard_images.compute_scs_0104_source(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['Ubuntu 24.04']), deps=('image_lookup', ))
+    c.add_function('scs_0104_source_ubuntu_2204', lambda c: standard_images.compute_scs_0104_source(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['Ubuntu 22.04']), deps=('image_lookup', ))
+    c.add_function('scs_0104_source_ubuntu_2004', lambda c: standard_images.compute_scs_0104_source(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['Ubuntu 20.04']), deps=('image_lookup', ))
+    c.add_function('scs_0104_source_debian_13', lambda c: standard_images.compute_scs_0104_source(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['Debian 13']), deps=('image_lookup', ))
+    c.add_function('scs_0104_source_debian_12', lambda c: standard_images.compute_scs_0104_source(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['Debian 12']), deps=('image_lookup', ))
+    c.add_function('scs_0104_source_debian_11', lambda c: standard_images.compute_scs_0104_source(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['Debian 11']), deps=('image_lookup', ))
+    c.add_function('scs_0104_source_debian_10', lambda c: standard_images.compute_scs_0104_source(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['Debian 10']), deps=('image_lookup', ))
+    c.add_function('scs_0104_image_capi_1', lambda c: standard_images.compute_scs_0104_image(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['ubuntu-capi-image-1']), deps=('image_lookup', ))
+    c.add_function('scs_0104_image_capi_2', lambda c: standard_images.compute_scs_0104_image(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['ubuntu-capi-image-2']), deps=('image_lookup', ))
+    c.add_function('scs_0104_image_ubuntu_2404', lambda c: standard_images.compute_scs_0104_image(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['Ubuntu 24.04']), deps=('image_lookup', ))
+    c.add_function('scs_0104_image_ubuntu_2204', lambda c: standard_images.compute_scs_0104_image(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['Ubuntu 22.04']), deps=('image_lookup', ))
+    c.add_function('scs_0104_image_ubuntu_2004', lambda c: standard_images.compute_scs_0104_image(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['Ubuntu 20.04']), deps=('image_lookup', ))
+    c.add_function('scs_0104_image_debian_13', lambda c: standard_images.compute_scs_0104_image(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['Debian 13']), deps=('image_lookup', ))
+    c.add_function('scs_0104_image_debian_12', lambda c: standard_images.compute_scs_0104_image(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['Debian 12']), deps=('image_lookup', ))
+    c.add_function('scs_0104_image_debian_11', lambda c: standard_images.compute_scs_0104_image(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['Debian 11']), deps=('image_lookup', ))
+    c.add_function('scs_0104_image_debian_10', lambda c: standard_images.compute_scs_0104_image(c.image_lookup, standard_images.SCS_0104_IMAGE_SPECS['Debian 10']), deps=('image_lookup', ))
     # scs_0114_volume_types
-    c.add_function('volume_types', lambda c: c.conn.list_volume_types())
-    c.add_function('volume_type_lookup', lambda c: compute_volume_type_lookup(c.volume_types))
-    c.add_function('scs_0114_syntax_check', lambda c: compute_scs_0114_syntax_check(c.volume_type_lookup))
-    c.add_function('scs_0114_encrypted_type', lambda c: compute_scs_0114_aspect_type(c.volume_type_lookup, 'encrypted'))
-    c.add_function('scs_0114_replicated_type', lambda c: compute_scs_0114_aspect_type(c.volume_type_lookup, 'replicated'))
+    c.add_function('volume_types', lambda c: c.conn.list_volume_types(), deps=('conn', ), api_calls=1)
+    c.add_function('volume_type_lookup', lambda c: volume_types.compute_volume_type_lookup(c.volume_types), deps=('volume_types', ))
+    c.add_function('scs_0114_syntax_check', lambda c: volume_types.compute_scs_0114_syntax_check(c.volume_type_lookup), deps=('volume_type_lookup', ))
+    c.add_function('scs_0114_encrypted_type', lambda c: volume_types.compute_scs_0114_aspect_type(c.volume_type_lookup, 'encrypted'), deps=('volume_type_lookup', ))
+    c.add_function('scs_0114_replicated_type', lambda c: volume_types.compute_scs_0114_aspect_type(c.volume_type_lookup, 'replicated'), deps=('volume_type_lookup', ))
     # scs_0115_security_groups
-    c.add_function('scs_0115_default_rules', lambda c: compute_scs_0115_default_rules(c.conn))
+    c.add_function('scs_0115_default_rules', lambda c: security_groups.compute_scs_0115_default_rules(c.conn), deps=('conn', ), api_calls=1)
     # scs_0116_key_manager
-    c.add_function('services_lookup', lambda c: compute_services_lookup(c.conn))
-    c.add_function('scs_0116_presence', lambda c: compute_scs_0116_presence(c.services_lookup))
-    c.add_function('scs_0116_permissions', lambda c: compute_scs_0116_permissions(c.conn, c.services_lookup))
+    c.add_function('services_lookup', lambda c: key_manager.compute_services_lookup(c.conn), deps=('conn', ))
+    c.add_function('scs_0116_presence', lambda c: key_manager.compute_scs_0116_presence(c.services_lookup), deps=('services_lookup', ))
+    c.add_function('scs_0116_permissions', lambda c: key_manager.compute_scs_0116_permissions(c.conn, c.services_lookup), deps=('conn', 'services_lookup'), api_calls=3)
     # scs_0117_volume_backup
-    c.add_function('scs_0117_test_backup', lambda c: compute_scs_0117_test_backup(c.conn))
+    c.add_function('scs_0117_test_backup', lambda c: volume_backup.compute_scs_0117_test_backup(c.conn), deps=('conn', ), api_calls=12)
     # scs_0123_mandatory_services
-    c.add_function('scs_0123_service_compute', lambda c: compute_scs_0123_service_presence(c.services_lookup, 'compute'))
-    c.add_function('scs_0123_service_identity', lambda c: compute_scs_0123_service_presence(c.services_lookup, 'identity'))
-    c.add_function('scs_0123_service_image', lambda c: compute_scs_0123_service_presence(c.services_lookup, 'image'))
-    c.add_function('scs_0123_service_network', lambda c: compute_scs_0123_service_presence(c.services_lookup, 'network'))
-    c.add_function('scs_0123_service_load_balancer', lambda c: compute_scs_0123_service_presence(c.services_lookup, 'load-balancer'))
-    c.add_function('scs_0123_service_placement', lambda c: compute_scs_0123_service_presence(c.services_lookup, 'placement'))
-    c.add_function('scs_0123_storage_apis', lambda c: compute_scs_0123_service_presence(c.services_lookup, 'volume', 'volumev3', 'block-storage'))
-    c.add_function('scs_0123_service_s3', lambda c: compute_scs_0123_service_presence(c.services_lookup, 'object-store-s3'))
-    c.add_function('scs_0123_swift_s3', lambda c: compute_scs_0123_swift_s3(c.services_lookup, c.conn))
+    c.add_function('scs_0123_service_compute', lambda c: mandatory_services.compute_scs_0123_service_presence(c.services_lookup, 'compute'), deps=('services_lookup', ))
+    c.add_function('scs_0123_service_identity', lambda c: mandatory_services.compute_scs_0123_service_presence(c.services_lookup, 'identity'), deps=('services_lookup', ))
+    c.add_function('scs_0123_service_image', lambda c: mandatory_services.compute_scs_0123_service_presence(c.services_lookup, 'image'), deps=('services_lookup', ))
+    c.add_function('scs_0123_service_network', lambda c: mandatory_services.compute_scs_0123_service_presence(c.services_lookup, 'network'), deps=('services_lookup', ))
+    c.add_function('scs_0123_service_load_balancer', lambda c: mandatory_services.compute_scs_0123_service_presence(c.services_lookup, 'load-balancer'), deps=('services_lookup', ))
+    c.add_function('scs_0123_service_placement', lambda c: mandatory_services.compute_scs_0123_service_presence(c.services_lookup, 'placement'), deps=('services_lookup', ))
+    c.add_function('scs_0123_storage_apis', lambda c: mandatory_services.compute_scs_0123_service_presence(c.services_lookup, 'volume', 'volumev3', 'block-storage'), deps=('services_lookup', ))
+    c.add_function('scs_0123_service_s3', lambda c: mandatory_services.compute_scs_0123_service_presence(c.services_lookup, 'object-store-s3'), deps=('services_lookup', ))
+    c.add_function('scs_0123_swift_s3', lambda c: mandatory_services.compute_scs_0123_swift_s3(c.services_lookup, c.conn), deps=('services_lookup', 'conn'), api_calls=5)
 
     return c
 
@@ -165,42 +204,268 @@ class Container:
     and the value will be memoized, so the function won't be called twice.
     If the function raises an exception, then this will be memoized just as well.
 
+    Values are memoized regardless of what they are (so `None` is fine). For each value, the container
+    counts the number of accesses and records the time it took to compute the value (see `timings`).
+
+    The container may be accessed from multiple threads: each value is computed only once, by the
+    thread that accesses it first, and any other thread accessing it in the meantime waits for it.
+
+    Cyclic dependencies are detected (rather than waiting forever), and a `RuntimeError` is raised.
+
+    The dependencies between the values are declared in advance (see `add_function`), so the values needed
+    for some given values can be determined without computing anything (see `plan`).
+
     For instance,
 
     >>>> container = Container()
     >>>> container.add_function('pi', lambda _: 22/7)
-    >>>> container.add_function('pi_squared', lambda c: c.pi * c.pi)
+    >>>> container.add_function('pi_squared', lambda c: c.pi * c.pi, deps=('pi', ))
     >>>> assert container.pi_squared == 22/7 * 22/7
     """
     def __init__(self):
-        self._values = {}
+        self._values = {}  # name -> Future
         self._functions = {}
+        self._deps = {}  # name -> names of the values that the function accesses on the container
+        self._api_calls = {}
+        self._accesses = {}  # name -> number of accesses
+        self._durations = {}  # name -> seconds spent computing the value (including waiting for dependencies)
+        self._owners = {}  # name of value being computed -> thread computing it
+        self._waiting = {}  # thread -> name of value that it waits for (computed by another thread)
+        self._lock = threading.Lock()
 
     def __getattr__(self, key):
-        val = self._values.get(key)
-        if val is None:
+        # NOTE: values are wrapped in futures, so no value (not even `None`) is mistaken for "not yet computed"
+        me = threading.get_ident()
+        with self._lock:
+            self._accesses[key] = self._accesses.get(key, 0) + 1
+            future = self._values.get(key)
+            pending = future is None
+            if pending:
+                future = self._values[key] = Future()
+                self._owners[key] = me
+            elif not future.done():
+                self._check_cycle(key, me)
+                self._waiting[me] = key
+        if pending:
             logger.debug(f'... {key}')
+            start = time.perf_counter()
             try:
-                ret = self._functions[key](self)
+                future.set_result(self._functions[key](self))
             except BaseException as e:
-                val = (True, e)
-            else:
-                val = (False, ret)
-            self._values[key] = val
-        error, ret = val
-        if error:
-            raise ret
-        return ret
-
-    def add_function(self, name, fn):
+                future.set_exception(e)
+            finally:
+                self._durations[key] = time.perf_counter() - start
+                with self._lock:
+                    del self._owners[key]
+        try:
+            return future.result()
+        finally:
+            if not pending:
+                with self._lock:
+                    self._waiting.pop(me, None)
+
+    def _check_cycle(self, key, me):
+        """raise RuntimeError if thread `me` waiting for `key` would wait for itself (call with lock held)"""
+        chain = [key]
+        owner = self._owners.get(key)
+        while owner is not None:
+            if owner == me:
+                raise RuntimeError(f"cyclic dependency: {' <- '.join(chain)}")
+            waited = self._waiting.get(owner)
+            if waited is None:
+                break
+            chain.append(waited)
+            owner = self._owners.get(waited)
+
+    def timings(self):
+        """return list of triples (name, seconds spent computing, number of accesses), most expensive first"""
+        with self._lock:
+            accesses = dict(self._accesses)
+            durations = dict(self._durations)
+        return sorted(
+            ((name, durations.get(name, 0.), count) for name, count in accesses.items()),
+            key=lambda item: item[1], reverse=True,
+        )
+
+    def add_function(self, name, fn, deps=(), api_calls=0):
+        """
+        Register `fn` for computing the value `name`.
+
+        The names of the values that `fn` accesses must be given via `deps`.
+        The number `api_calls` is only used for `plan`.
+        """
         if name in self._functions:
             raise RuntimeError(f"fn {name} already registered")
         self._functions[name] = fn
+        self._deps[name] = tuple(deps)
+        self._api_calls[name] = api_calls
+
+    def dependencies(self, name):
+        """return names of the values that the function for `name` depends on directly"""
+        return tuple(dep for dep in self._deps.get(name, ()) if dep in self._functions)
+
+    def is_registered(self, name):
+        return name in self._functions
+
+    def api_calls(self, name):
+        return self._api_calls.get(name, 0)
+
+    def plan(self, names):
+        """return names of all values needed for `names` in topological order (dependencies first)
+
+        Raises RuntimeError in case of a cyclic dependency.
+        """
+        order = []
+        seen = set()
+        visiting = []
+
+        def visit(name):
+            if name in visiting:
+                raise RuntimeError(f"cyclic dependency: {' <- '.join(visiting[visiting.index(name):] + [name])}")
+            if name in seen:
+                return
+            visiting.append(name)
+            for dep in self.dependencies(name):
+                visit(dep)
+            visiting.pop()
+            seen.add(name)
+            order.append(name)
+
+        for name in names:
+            visit(name)
+        return order
+
+    def copy(self, keys=()):
+        """return container with the same functions, and with the values of `keys` if already computed"""
+        other = Container()
+        other._functions = dict(self._functions)
+        other._deps = dict(self._deps)
+        other._api_calls = dict(self._api_calls)
+        with self._lock:
+            futures = [(key, self._values.get(key)) for key in keys]
+        # don't copy memoized exceptions: these are probably due to some transient problem
+        other._values = {
+            key: future for key, future in futures
+            if future is not None and future.done() and future.exception() is None
+        }
+        return other
 
     def add_value(self, name, value):
-        if name in self._values:
-            raise RuntimeError(f"value {name} already registered")
-        self._values[name] = value
+        future = Future()
+        future.set_result(value)
+        with self._lock:
+            if name in self._values:
+                raise RuntimeError(f"value {name} already registered")
+            self._values[name] = future
+
+
+def compute_fingerprint(resources):
+    """compute hash of the list `resources` that changes whenever any field of any resource changes"""
+    dicts = sorted((resource.to_dict() for resource in resources), key=lambda d: d.get('id') or '')
+    return hashlib.sha256(json.dumps(dicts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _hash_code(*dirnames):
+    """compute hash of the Python sources in the directories `dirnames` (relative to this file)"""
+    digest = hashlib.sha256()
+    basedir = os.path.dirname(os.path.abspath(__file__))
+    for dirname in dirnames:
+        for fname in sorted(os.listdir(os.path.join(basedir, dirname))):
+            if fname.endswith('.py'):
+                with open(os.path.join(basedir, dirname, fname), 'rb') as fileobj:
+                    digest.update(fileobj.read())
+    return digest.hexdigest()
+
+
+# testcases whose verdict is a function of some listings only (not of time or any further API calls)
+# triples (testcase prefix, directories with the code, listings); first match wins
+CACHEABLE_TESTCASES = (
+    # the following two depend on the current time
+    ('scs_0102_prop_image_build_date', None, None),
+    ('scs_0102_image_recency', None, None),
+    ('scs_0100_', ('scs_0100_flavor_naming', ), ('flavors', )),
+    ('scs_0102_', ('scs_0102_image_metadata', ), ('images', )),
+    ('scs_0103_flavor_', ('scs_0103_standard_flavors', 'scs_0100_flavor_naming'), ('flavors', )),
+    ('scs_0104_', ('scs_0104_standard_images', ), ('images', )),
+    ('scs_0114_', ('scs_0114_volume_types', ), ('volume_types', )),
+)
+
+
+# list that collects log records of the testcase currently being evaluated (see `cached_harness`), if any
+_log_records = contextvars.ContextVar('log_records', default=None)
+
+
+class _LogCollector(logging.Handler):
+    """collects log records (level INFO and up) so they can be replayed when a cached verdict is used"""
+    def __init__(self):
+        super().__init__(level=logging.INFO)
+
+    def emit(self, record):
+        records = _log_records.get()
+        if records is not None:
+            records.append((record.levelno, record.name, record.getMessage()))
+
+
+class ResultCache:
+    """
+    Persistent cache of verdicts of the testcases listed in `CACHEABLE_TESTCASES`.
+
+    A verdict is stored together with the log output of its computation under a key that is derived
+    from the fingerprints of the listings the testcase depends on as well as from the code of the testcase;
+    so the verdict is reused only if neither the cloud nor the code has changed in any relevant way.
+    """
+    def __init__(self, path, cloud):
+        self.path = path
+        self.cloud = cloud
+        self._code_hashes = {}
+        try:
+            with open(path, "r", encoding="UTF-8") as fileobj:
+                fcntl.flock(fileobj, fcntl.LOCK_SH)
+                data = json.load(fileobj)
+        except FileNotFoundError:
+            data = {}
+        except ValueError:
+            logger.warning(f"ignoring corrupt cache file {path}")
+            data = {}
+        self._entries = data.get(cloud, {})
+
+    def make_key(self, container, testcase):
+        """return cache key for `testcase` (in its attribute form) or None if it can't be cached"""
+        for prefix, dirnames, listings in CACHEABLE_TESTCASES:
+            if testcase.startswith(prefix):
+                break
+        else:
+            return None
+        if not dirnames:
+            return None
+        code_hash = self._code_hashes.get(dirnames)
+        if code_hash is None:
+            code_hash = self._code_hashes[dirnames] = _hash_code(*dirnames)
+        parts = [code_hash, *(getattr(container, f'{listing}_fingerprint') for listing in listings)]
+        return hashlib.sha256(' '.join(parts).encode()).hexdigest()
+
+    def get(self, testcase, key):
+        entry = self._entries.get(testcase)
+        if entry is None or entry['key'] != key:
+            return None
+        return entry
+
+    def put(self, testcase, key, result, records):
+        self._entries[testcase] = {'key': key, 'result': result, 'log': records}
+
+    def save(self):
+        # runs for other clouds may share the file, so re-read it and only replace the entries of our cloud
+        with open(self.path, "a+", encoding="UTF-8") as fileobj:
+            fcntl.flock(fileobj, fcntl.LOCK_EX)
+            fileobj.seek(0)
+            try:
+                data = json.load(fileobj)
+            except ValueError:
+                data = {}
+            data[self.cloud] = self._entries
+            fileobj.seek(0)
+            fileobj.truncate()
+            json.dump(data, fileobj)
 
 
 def harness(name, *check_fns):
@@ -208,7 +473,7 @@ def harness(name, *check_fns):
 
     Logs beginning of computation.
     Calls each fn in `check_fns`.
-    Prints (to stdout) 'name: RESULT', where RESULT is one of
+    Returns RESULT, to be printed (to stdout) as 'name: RESULT', where RESULT is one of
 
     - 'ABORT' if an exception occurs during the function calls
     - 'FAIL' if one of the functions has a falsy result
@@ -224,7 +489,35 @@ def harness(name, *check_fns):
         result = ['FAIL', 'PASS'][min(1, result)]
     # this is quite redundant
     # logger.debug(f'** computation end for {name}')
-    print(f"{name}: {result}")
+    return result
+
+
+def cached_harness(cache, container, name, check_fn):
+    """Like `harness`, but reuse verdict (and log output) from `cache` if possible, and store it otherwise."""
+    testcase = name.replace('-', '_')
+    try:
+        key = cache.make_key(container, testcase)
+    except BaseException:
+        logger.debug('exception during computation of cache key', exc_info=True)
+        key = None
+    if key is None:
+        return harness(name, check_fn)
+    entry = cache.get(testcase, key)
+    if entry is not None:
+        for levelno, logger_name, message in entry['log']:
+            logging.getLogger(logger_name).log(levelno, message)
+        logger.info(f"{name}: cache hit, reusing verdict (key {key[:12]})")
+        return entry['result']
+    records = []
+    token = _log_records.set(records)
+    try:
+        result = harness(name, check_fn)
+    finally:
+        _log_records.reset(token)
+    # don't cache ABORT: it's usually due to some transient problem
+    if result != 'ABORT':
+        cache.put(testcase, key, result, records)
+    return result
 
 
 def run_preflight_checks(container):
@@ -236,56 +529,321 @@ def run_preflight_checks(container):
     except openstack.exceptions.ConfigException:
         logger.critical("Please make sure that ~/.config/openstack/clouds.yaml exists and is correct!")
         raise
-    if "member" not in ensure_unprivileged(conn, quiet=True):
+    if "member" not in key_manager.ensure_unprivileged(conn, quiet=True):
         logger.critical("Please make sure that your OpenStack user has role member.")
         raise RuntimeError("OpenStack user is missing member role.")
 
 
-def main(argv):
-    # configure logging, disable verbose library logging
-    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG)
-    openstack.enable_logging(debug=False)
-    cloud = None
-
-    try:
-        cloud = os.environ["OS_CLOUD"]
-    except KeyError:
-        pass
+class Config:
+    def __init__(self, environ=os.environ):
+        self.cloud = environ.get("OS_CLOUD")
+        self.cache_path = None
+        self.serve = None
+        self.ttl = LISTING_TTL
+        self.jobs = DEFAULT_JOBS
+        self.plan = False
+        self.debug_timing = False
+        self.testcases = []
+
+    def apply_argv(self, argv):
+        """Parse options. May exit the program."""
+        try:
+            opts, args = getopt.gnu_getopt(argv, "c:C:j:", ("os-cloud=", "cache=", "serve=", "ttl=", "jobs=", "plan", "debug-timing"))
+        except getopt.GetoptError as exc:
+            print(f"CRITICAL: {exc!r}", file=sys.stderr)
+            usage(1)
+        for opt in opts:
+            if opt[0] == "-h" or opt[0] == "--help":
+                usage(0)
+            elif opt[0] == "-c" or opt[0] == "--os-cloud":
+                self.cloud = opt[1]
+            elif opt[0] == "-j" or opt[0] == "--jobs":
+                self.jobs = int(opt[1])
+            elif opt[0] == "--plan":
+                self.plan = True
+            elif opt[0] == "--debug-timing":
+                self.debug_timing = True
+            elif opt[0] == "--cache":
+                self.cache_path = opt[1]
+            elif opt[0] == "--serve":
+                self.serve = opt[1]
+            elif opt[0] == "--ttl":
+                self.ttl = float(opt[1])
+            else:
+                usage(2)
+
+        self.testcases = [t for t in args if t.startswith('scs-')]
+        if len(self.testcases) != len(args):
+            unknown = [a for a in args if a not in self.testcases]
+            logger.warning(f"ignoring unknown testcases: {','.join(unknown)}")
+
+
+def select_base_resources(c, names):
+    """return those of the values `names` that only depend on the connection (such as listings)"""
+    return [name for name in names if c.dependencies(name) == ('conn', ) and not name.startswith('scs_')]
+
+
+def print_plan(c, testcases):
+    """print values needed for `testcases` (with their dependencies) and the estimated number of API calls"""
+    needed = c.plan([testcase.replace('-', '_') for testcase in testcases])
+    for name in needed:
+        if not c.is_registered(name):
+            print(f"{name} (unknown)")
+            continue
+        deps = c.dependencies(name)
+        api_calls = c.api_calls(name)
+        line = name
+        if deps:
+            line += f" <- {', '.join(deps)}"
+        if api_calls:
+            line += f" [{api_calls} API call{'s' if api_calls > 1 else ''}]"
+        print(line)
+    print(f"prefetch: {', '.join(select_base_resources(c, needed)) or '-'}")
+    print(f"estimated number of API calls: {sum(c.api_calls(name) for name in needed)} (not counting polling)")
+
+
+def print_timings(c, file=None):
+    """print time spent computing each value of `c` and the number of accesses"""
+    file = file or sys.stderr
+    print("TIMING: seconds spent computing (including waiting for dependencies), accesses, value", file=file)
+    for name, duration, count in c.timings():
+        print(f"TIMING: {duration:8.3f} {count:4d}  {name}", file=file)
+
+
+def _prefetch(c, name):
     try:
-        opts, args = getopt.gnu_getopt(argv, "c:C:", ("os-cloud=", ))
-    except getopt.GetoptError as exc:
-        print(f"CRITICAL: {exc!r}", file=sys.stderr)
-        usage(1)
-    for opt in opts:
-        if opt[0] == "-h" or opt[0] == "--help":
-            usage(0)
-        elif opt[0] == "-c" or opt[0] == "--os-cloud":
-            cloud = opt[1]
-        else:
-            usage(2)
+        getattr(c, name)
+    except BaseException:
+        pass  # memoized, so it will be reported by each testcase that needs this value
 
-    testcases = [t for t in args if t.startswith('scs-')]
-    if len(testcases) != len(args):
-        unknown = [a for a in args if a not in testcases]
-        logger.warning(f"ignoring unknown testcases: {','.join(unknown)}")
 
-    if not cloud:
-        print("CRITICAL: You need to have OS_CLOUD set or pass --os-cloud=CLOUD.", file=sys.stderr)
-        sys.exit(1)
+def run_testcases(config, c):
+    """run testcases given by `config` using container `c`, printing results to stdout"""
+    if config.plan:
+        print_plan(c, config.testcases)
+        return 0
+    if not config.debug_timing:
+        return _run_testcases(config, c)
+    try:
+        return _run_testcases(config, c)
+    finally:
+        print_timings(c)
+
 
-    c = make_container(cloud)
+def _run_testcases(config, c):
     try:
         run_preflight_checks(c)
     except Exception:
         logger.critical("Pre-flight checks failed. Reporting all testcases as ABORT.")
-        for testcase in testcases:
+        for testcase in config.testcases:
             print(f"{testcase}: ABORT")
         raise
-    for testcase in testcases:
-        harness(testcase, lambda: getattr(c, testcase.replace('-', '_')))
+    cache = ResultCache(config.cache_path, config.cloud) if config.cache_path else None
+
+    def evaluate(testcase):
+        check_fn = lambda: getattr(c, testcase.replace('-', '_'))  # noqa: E731
+        if cache is None:
+            return harness(testcase, check_fn)
+        return cached_harness(cache, c, testcase, check_fn)
+
+    # testcases are evaluated concurrently (as far as their values don't depend on each other; see `Container`),
+    # but results are printed in the given order; each task gets a copy of our context (see `_request_output`)
+    with ThreadPoolExecutor(max_workers=max(1, config.jobs)) as executor:
+        # fetch the base resources needed up front and concurrently, rather than one after another as needed
+        base_resources = select_base_resources(c, c.plan([testcase.replace('-', '_') for testcase in config.testcases]))
+        logger.debug(f"prefetching: {', '.join(base_resources)}")
+        for name in base_resources:
+            executor.submit(contextvars.copy_context().run, _prefetch, c, name)
+        futures = [
+            executor.submit(contextvars.copy_context().run, evaluate, testcase)
+            for testcase in config.testcases
+        ]
+        for testcase, future in zip(config.testcases, futures):
+            print(f"{testcase}: {future.result()}")
+    if cache is not None:
+        cache.save()
+    return 0
+
+
+# pair of streams (stdout, stderr) of the request currently being handled by the daemon, if any
+_request_output = contextvars.ContextVar('request_output', default=None)
+
+
+class _RequestStream(io.TextIOBase):
+    """text stream that forwards to the respective stream of the current request, if any, else to `fallback`"""
+    def __init__(self, index, fallback):
+        super().__init__()
+        self.index = index
+        self.fallback = fallback
+
+    def _target(self):
+        output = _request_output.get()
+        return self.fallback if output is None else output[self.index]
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+
+class RequestRefused(Exception):
+    """raised by `Worker.run` if a request can't be handled exactly as if the script were run directly"""
+
+
+# files that the SDK looks for in the working directory (before looking elsewhere)
+SDK_CONFIG_FILES = ('clouds.yaml', 'clouds.yml', 'clouds.json', 'secure.yaml', 'secure.yml', 'secure.json')
+
+
+def _check_sdk_config(environ, cwd):
+    """raise `RequestRefused` unless the SDK would use the same config with `environ` and `cwd` as here"""
+    # OS_CLOUD is exempt because it's passed to the SDK explicitly (see `connect`)
+    ours = {key: value for key, value in os.environ.items() if key.startswith('OS_') and key != 'OS_CLOUD'}
+    theirs = {key: value for key, value in environ.items() if key.startswith('OS_') and key != 'OS_CLOUD'}
+    if ours != theirs:
+        differing = sorted(key for key in ours.keys() | theirs.keys() if ours.get(key) != theirs.get(key))
+        raise RequestRefused(f"environment differs from the daemon's: {', '.join(differing)}")
+    here = os.getcwd()
+    if os.path.realpath(cwd) != os.path.realpath(here):
+        found = [fn for path in (cwd, here) for fn in SDK_CONFIG_FILES if os.path.exists(os.path.join(path, fn))]
+        if found:
+            raise RequestRefused(f"working directory differs from the daemon's, and it has {', '.join(found)}")
+
+
+class Worker:
+    """
+    Handles requests for the daemon (see `serve`).
+
+    For each cloud, keeps a container holding the values given by `SHARED_KEYS`, that is, the
+    authenticated connection and the listings; the latter are dropped after `ttl` seconds.
+    Requests for the same cloud are handled one after another, so they share these values.
+    """
+    def __init__(self, ttl=LISTING_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._states = {}  # cloud -> [lock, container, expiry]
+
+    def _get_state(self, cloud):
+        with self._lock:
+            state = self._states.get(cloud)
+            if state is None:
+                state = self._states[cloud] = [threading.Lock(), make_container(cloud), 0.]
+            return state
+
+    def run(self, argv, environ, cwd=None):
+        """handle request to run testcases according to `argv`, `environ`, and `cwd` (just like `main`)"""
+        cwd = cwd or os.getcwd()
+        _check_sdk_config(environ, cwd)
+        config = Config(environ)
+        config.apply_argv(argv)
+        if config.serve:
+            raise RuntimeError("option --serve not allowed in request")
+        if config.cache_path:
+            config.cache_path = os.path.join(cwd, config.cache_path)
+        if not config.cloud:
+            print("CRITICAL: You need to have OS_CLOUD set or pass --os-cloud=CLOUD.", file=sys.stderr)
+            return 1
+        state = self._get_state(config.cloud)
+        with state[0]:
+            now = time.monotonic()
+            if now >= state[2]:
+                # listings expired: keep connection only
+                state[1], state[2] = state[1].copy(('conn', )), now + self.ttl
+            c = state[1].copy(SHARED_KEYS)
+            try:
+                return run_testcases(config, c)
+            finally:
+                # keep whatever the request has computed in addition
+                state[1] = c.copy(SHARED_KEYS)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles one request of the daemon (see `serve`).
+
+    A request is one line of JSON, namely an object with fields `args` (list of command-line arguments),
+    `env` (environment variables, of which those starting with OS_ are relevant), and `cwd` (working
+    directory). The response is one line of JSON, namely an object with fields `rc`, `stdout`, and `stderr`,
+    just like the result of running this script with the given arguments -- or, if the request is refused
+    because running the script directly could make a difference (see `_check_sdk_config`), an object with
+    the field `refused` giving the reason.
+    """
+    def handle(self):
+        start = time.monotonic()
+        request = json.loads(self.rfile.readline())
+        stdout, stderr = io.StringIO(), io.StringIO()
+        token = _request_output.set((stdout, stderr))
+        refused = None
+        try:
+            rc = self.server.worker.run(request['args'], request.get('env', {}), request.get('cwd'))
+        except RequestRefused as exc:
+            refused = str(exc)
+        except SystemExit as exc:
+            rc = exc.code if isinstance(exc.code, int) else 1
+        except BaseException as exc:
+            print(f"CRITICAL: {exc!r}", file=sys.stderr)
+            rc = 1
+        finally:
+            _request_output.reset(token)
+        if refused is not None:
+            logger.info(f"request {' '.join(request['args'])}: refused: {refused}")
+            response = {'refused': refused}
+        else:
+            logger.info(f"request {' '.join(request['args'])}: rc {rc}, {time.monotonic() - start:.1f} s")
+            response = {'rc': rc, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+        self.wfile.write(json.dumps(response).encode('UTF-8') + b'\n')
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path, ttl=LISTING_TTL):
+    """run as daemon, handling requests (see `_RequestHandler`) at unix socket `socket_path`"""
+    # route output of each request to its response
+    sys.stdout = _RequestStream(0, sys.stdout)
+    sys.stderr = _RequestStream(1, sys.stderr)
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(sys.stderr)
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(socket_path)
+    # the socket must only be accessible by the current user
+    umask = os.umask(0o177)
+    try:
+        server = _Server(socket_path, _RequestHandler)
+    finally:
+        os.umask(umask)
+    server.worker = Worker(ttl)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    logger.info(f"serving at {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
     return 0
 
 
+def main(argv):
+    # configure logging
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG)
+    logging.getLogger().addHandler(_LogCollector())
+    config = Config()
+    config.apply_argv(argv)
+
+    if config.serve:
+        return serve(config.serve, config.ttl)
+
+    if not config.cloud and not config.plan:
+        print("CRITICAL: You need to have OS_CLOUD set or pass --os-cloud=CLOUD.", file=sys.stderr)
+        sys.exit(1)
+
+    return run_testcases(config, make_container(config.cloud))
+
+
 if __name__ == "__main__":
     try:
         sys.exit(main(sys.argv[1:]))
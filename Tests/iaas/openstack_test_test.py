@@ -0,0 +1,291 @@
+"""
+Regression tests for openstack_test.py
+
+The SDK as well as the testcase modules must only be imported once they are needed,
+and the dependencies between values must be recorded such that we can plan ahead.
+Values computed by the container must be memoized, whatever they are.
+Cached verdicts must only be reused as long as neither the listings nor the code change,
+and the daemon must refuse requests that it can't serve just like the script would.
+
+SPDX-License-Identifier: CC-BY-SA 4.0
+"""
+
+import fcntl
+import json
+import logging
+import os.path
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# packages that must not be imported unless some testcase actually needs them (as well as the testcase packages)
+HEAVY_PACKAGES = ('openstack', 'keystoneauth1', 'boto3', 'botocore', 'yaml')
+
+
+def measure_imports(code):
+    """run `code` with `python -X importtime`, return dict mapping module name to cumulative time in us"""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        stderr=subprocess.PIPE, encoding='UTF-8', check=True, cwd=HERE,
+    )
+    result = {}
+    # lines have the form "import time:  self [us] | cumulative | imported package" (indented by depth)
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        if cumulative.strip().isdigit():
+            result[name.strip()] = int(cumulative)
+    return result
+
+
+@pytest.mark.parametrize("code, allowed", [
+    ("import openstack_test", ()),
+    # registration needs the list of canonical flavor names, but nothing else
+    ("import openstack_test; openstack_test.make_container('x')", ('scs_0103_standard_flavors', )),
+])
+def test_no_eager_imports(code, allowed):
+    modules = measure_imports(code)
+    assert 'openstack_test' in modules
+    packages = {name.split('.')[0] for name in modules}
+    offenders = [
+        package for package in packages
+        if (package in HEAVY_PACKAGES or package.startswith('scs_01')) and package not in allowed
+    ]
+    assert not offenders
+
+
+def test_import_time():
+    pytest.importorskip('openstack')
+    own = measure_imports("import openstack_test")['openstack_test']
+    sdk = measure_imports("import openstack")['openstack']
+    # importing the SDK takes hundreds of milliseconds; we should be way below that
+    assert own * 4 < sdk
+
+
+class _Stop(BaseException):
+    """raised when a dummy value is used (deliberately no `Exception`, so that it isn't caught)"""
+
+
+class _Dummy:
+    """value that raises `_Stop` when it is used"""
+    def _stop(self, *args):
+        raise _Stop
+
+    __getattr__ = __iter__ = __len__ = __getitem__ = __contains__ = __bool__ = __call__ = _stop
+
+
+class _Recorder:
+    """stand-in for the container that records which values are accessed"""
+    def __init__(self):
+        self.accessed = set()
+
+    def __getattr__(self, name):
+        self.accessed.add(name)
+        return _Dummy()
+
+
+def test_declared_dependencies(monkeypatch):
+    pytest.importorskip('openstack')
+    import openstack_test
+    monkeypatch.setattr(openstack_test, 'connect', lambda cloud: _Dummy())
+    c = openstack_test.make_container('x')
+    wrong = {}
+    for name, fn in c._functions.items():
+        recorder = _Recorder()
+        try:
+            fn(recorder)
+        except (_Stop, Exception):
+            pass
+        if recorder.accessed != set(c.dependencies(name)):
+            wrong[name] = sorted(recorder.accessed)
+    assert not wrong
+
+
+def test_cyclic_dependency():
+    import openstack_test
+    c = openstack_test.Container()
+    c.add_function('egg', lambda c: c.hen, deps=('hen', ))
+    c.add_function('hen', lambda c: c.egg, deps=('egg', ))
+    with pytest.raises(RuntimeError, match='cyclic'):
+        c.plan(['egg'])
+    with pytest.raises(RuntimeError, match='cyclic'):
+        c.egg
+
+
+def test_plan():
+    import openstack_test
+    c = openstack_test.make_container('x')
+    assert c.dependencies('images') == ('conn', )
+    assert c.dependencies('collected_vm_output') == ('conn', 'flavors', 'canonical_image')
+    assert c.plan(['scs_0104_image_debian_12', 'scs_0103_flavor_1v_4']) == [
+        'conn', 'images', 'image_lookup', 'scs_0104_image_debian_12',
+        'flavors', 'flavor_lookup', 'scs_0103_flavor_1v_4',
+    ]
+    assert openstack_test.select_base_resources(c, c.plan(['scs_0101_entropy_avail'])) == ['flavors', 'images']
+
+
+def test_memoize_none():
+    import openstack_test
+    calls = []
+    c = openstack_test.Container()
+    c.add_function('nothing', lambda _: calls.append(1))
+    c.add_function('still_nothing', lambda c: c.nothing)
+    assert c.still_nothing is None
+    assert c.nothing is None
+    assert c.still_nothing is None
+    assert len(calls) == 1
+    accesses = {name: count for name, _, count in c.timings()}
+    assert accesses == {'nothing': 2, 'still_nothing': 2}
+
+
+class _Listings:
+    """stand-in for the container that only provides fingerprints of listings"""
+    def __init__(self, flavors='f0', images='i0', volume_types='v0'):
+        self.flavors_fingerprint = flavors
+        self.images_fingerprint = images
+        self.volume_types_fingerprint = volume_types
+
+
+def test_cache_key(tmp_path, monkeypatch):
+    import openstack_test
+    cache = openstack_test.ResultCache(str(tmp_path / 'cache.json'), 'x')
+    key = cache.make_key(_Listings(), 'scs_0100_syntax_check')
+    assert key == cache.make_key(_Listings(images='i1'), 'scs_0100_syntax_check')
+    assert key != cache.make_key(_Listings(flavors='f1'), 'scs_0100_syntax_check')
+    # time-dependent testcases can't be cached, and neither can unknown ones
+    assert cache.make_key(_Listings(), 'scs_0102_image_recency') is None
+    assert cache.make_key(_Listings(), 'scs_0123_service_compute') is None
+    # the code is hashed once per cache (that is, per run)
+    monkeypatch.setattr(openstack_test, '_hash_code', lambda *dirnames: 'changed')
+    assert key == cache.make_key(_Listings(), 'scs_0100_syntax_check')
+    other = openstack_test.ResultCache(str(tmp_path / 'cache.json'), 'x')
+    assert key != other.make_key(_Listings(), 'scs_0100_syntax_check')
+
+
+def test_cached_harness(tmp_path):
+    import openstack_test
+    path = str(tmp_path / 'cache.json')
+    calls = []
+
+    def check_fn():
+        calls.append(1)
+        openstack_test.logger.warning("some flavor is off")
+        return False
+
+    def run(listings):
+        cache = openstack_test.ResultCache(path, 'x')
+        result = openstack_test.cached_harness(cache, listings, 'scs-0100-syntax-check', check_fn)
+        cache.save()
+        return result
+
+    handler = openstack_test._LogCollector()
+    logging.getLogger().addHandler(handler)
+    try:
+        assert run(_Listings()) == 'FAIL'
+        assert run(_Listings()) == 'FAIL'
+        assert len(calls) == 1
+        assert run(_Listings(flavors='f1')) == 'FAIL'
+        assert len(calls) == 2
+    finally:
+        logging.getLogger().removeHandler(handler)
+    with open(path, encoding='UTF-8') as fileobj:
+        entry = json.load(fileobj)['x']['scs_0100_syntax_check']
+    assert entry['log'] == [[logging.WARNING, openstack_test.logger.name, "some flavor is off"]]
+
+
+def test_cache_file_shared_by_clouds(tmp_path):
+    import openstack_test
+    path = str(tmp_path / 'cache.json')
+    caches = [openstack_test.ResultCache(path, cloud) for cloud in ('x', 'y')]
+    for cache in caches:
+        cache.put('scs_0100_syntax_check', cache.cloud, 'PASS', [])
+    for cache in caches:
+        cache.save()
+    with open(path, encoding='UTF-8') as fileobj:
+        data = json.load(fileobj)
+    assert {cloud: entries['scs_0100_syntax_check']['key'] for cloud, entries in data.items()} == {'x': 'x', 'y': 'y'}
+
+
+def test_cache_file_locked(tmp_path):
+    import openstack_test
+    path = tmp_path / 'cache.json'
+    path.write_text('{"y": {}}')
+    cache = openstack_test.ResultCache(str(path), 'x')
+    cache.put('scs_0100_syntax_check', 'key', 'PASS', [])
+    with open(path, encoding='UTF-8') as fileobj:
+        fcntl.flock(fileobj, fcntl.LOCK_EX)
+        thread = threading.Thread(target=cache.save)
+        thread.start()
+        thread.join(0.2)
+        # must wait for the lock to be released
+        assert thread.is_alive()
+        assert json.loads(path.read_text()) == {'y': {}}
+    thread.join(5)
+    assert not thread.is_alive()
+    assert json.loads(path.read_text()).keys() == {'x', 'y'}
+
+
+def test_refuse_differing_sdk_config(tmp_path, monkeypatch):
+    import openstack_test
+    daemon_dir, client_dir = tmp_path / 'daemon', tmp_path / 'client'
+    daemon_dir.mkdir()
+    client_dir.mkdir()
+    monkeypatch.chdir(daemon_dir)
+    monkeypatch.setenv('OS_CLOUD', 'x')
+    monkeypatch.setenv('OS_CLIENT_CONFIG_FILE', '/etc/openstack/clouds.yaml')
+    worker = openstack_test.Worker()
+    with pytest.raises(openstack_test.RequestRefused, match='OS_CLIENT_CONFIG_FILE'):
+        worker.run(['scs-0100-syntax-check'], {'OS_CLOUD': 'x'}, str(client_dir))
+    environ = {'OS_CLOUD': 'y', 'OS_CLIENT_CONFIG_FILE': '/etc/openstack/clouds.yaml'}
+    # OS_CLOUD may differ, and so may the working directory unless the SDK would look for its config there
+    openstack_test._check_sdk_config(environ, str(client_dir))
+    (client_dir / 'clouds.yaml').write_text('clouds: {}\n')
+    with pytest.raises(openstack_test.RequestRefused, match='clouds.yaml'):
+        worker.run(['scs-0100-syntax-check'], environ, str(client_dir))
+    openstack_test._check_sdk_config(environ, str(daemon_dir))
+
+
+@pytest.mark.parametrize("outcome", [42, ValueError("no cloud")])
+def test_concurrent_access(outcome):
+    import openstack_test
+    num_threads = 8
+    calls = []
+    release = threading.Event()
+
+    def compute(_):
+        calls.append(1)
+        # make sure every other thread asks for the value while it is being computed
+        assert release.wait(5)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    c = openstack_test.Container()
+    c.add_function('slow', compute)
+    outcomes = [None] * num_threads
+
+    def access(idx):
+        try:
+            outcomes[idx] = c.slow
+        except Exception as e:
+            outcomes[idx] = e
+
+    threads = [threading.Thread(target=access, args=(idx, )) for idx in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while dict((name, count) for name, _, count in c.timings()).get('slow') != num_threads:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    # every waiter gets the very same value, or the very same exception
+    assert all(item is outcome for item in outcomes)
@@ -22,15 +22,18 @@ import os.path
 import uuid
 import re
 import sys
+import json
 import shlex
+import socket
 import getopt
 import datetime
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from itertools import chain
 import logging
 import yaml
 
-from scs_cert_lib import load_spec, annotate_validity, eval_buckets, TESTCASE_VERDICTS
+from scs_cert_lib import load_spec, annotate_validity, add_period, eval_buckets, TESTCASE_VERDICTS
 
 
 logger = logging.getLogger(__name__)
@@ -55,13 +58,47 @@ Options:
   -o/--output REPORT_FILEPATH: Generate yaml report of compliance check in given filepath
   -C/--critical-only: Only return critical errors in return code
   -a/--assign KEY=VALUE: assign variable to be used for the run (as required by yaml file)
+  -j/--jobs N: run up to N scripts concurrently (default: 1); output and report keep the order of the spec
+     --incremental PREVIOUS_REPORT: reuse passing results from PREVIOUS_REPORT that are still within
+       their lifetime instead of re-checking them, and include them in the new report
+     --dispatch EXECUTABLE=SOCKET: send invocations of EXECUTABLE (as given in the spec, or its basename)
+       to the worker listening at unix socket SOCKET (see `openstack_test.py --serve`) instead of
+       spawning a new process each time
 
 With -C, the return code will be nonzero precisely when the tests couldn't be run to completion.
 """, file=file)
 
 
-def run_check_tool(executable, args, env=None, cwd=None):
-    """Run executable and return `CompletedProcess` instance"""
+class DispatchRefused(RuntimeError):
+    """raised if the worker refuses a request because running the script directly could make a difference"""
+
+
+def run_worker_request(socket_path, args, env, cwd):
+    """Send request to run with `args`, `env`, and `cwd` to worker at `socket_path`; return `CompletedProcess`"""
+    # the worker only needs the OpenStack-related variables
+    request = {
+        'args': shlex.split(args),
+        'env': {key: value for key, value in env.items() if key.startswith('OS_')},
+        'cwd': os.path.abspath(cwd or "."),
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        with sock.makefile('rwb') as fileobj:
+            fileobj.write(json.dumps(request).encode('UTF-8') + b'\n')
+            fileobj.flush()
+            response = json.loads(fileobj.readline())
+    if 'refused' in response:
+        raise DispatchRefused(response['refused'])
+    return subprocess.CompletedProcess(request['args'], response['rc'], response['stdout'], response['stderr'])
+
+
+def run_check_tool(executable, args, env=None, cwd=None, socket_path=None):
+    """Run executable (or send request to worker at `socket_path`) and return `CompletedProcess` instance"""
+    if socket_path is not None:
+        try:
+            return run_worker_request(socket_path, args, env or {}, cwd)
+        except (OSError, DispatchRefused) as exc:
+            logger.warning(f"worker at {socket_path} not available, running {executable} directly: {exc!s}")
     if executable.startswith("http://") or executable.startswith("https://"):
         # TODO: When we start supporting this, consider security concerns
         # Running downloaded code is always risky
@@ -97,13 +134,17 @@ class Config:
         self.sections = None
         self.critical_only = False
         self.tests = None
+        self.jobs = 1
+        self.incremental = None
+        self.dispatch = {}
 
     def apply_argv(self, argv):
         """Parse options. May exit the program."""
         try:
-            opts, args = getopt.gnu_getopt(argv, "hvqd:V:s:o:S:Ca:t:", (
+            opts, args = getopt.gnu_getopt(argv, "hvqd:V:s:o:S:Ca:t:j:", (
                 "help", "verbose", "quiet", "date=", "version=", "debug",
-                "subject=", "output=", "sections=", "critical-only", "assign=", "tests=",
+                "subject=", "output=", "sections=", "critical-only", "assign=", "tests=", "jobs=",
+                "incremental=", "dispatch=",
             ))
         except getopt.GetoptError:
             usage(file=sys.stderr)
@@ -140,6 +181,15 @@ class Config:
                 self.assignment[key] = value
             elif opt[0] == "-t" or opt[0] == "--tests":
                 self.tests = re.compile(opt[1])
+            elif opt[0] == "-j" or opt[0] == "--jobs":
+                self.jobs = int(opt[1])
+                if self.jobs < 1:
+                    raise ValueError(f"Number of jobs must be positive: {opt[1]!r}")
+            elif opt[0] == "--incremental":
+                self.incremental = opt[1]
+            elif opt[0] == "--dispatch":
+                executable, socket_path = opt[1].split("=", 1)
+                self.dispatch[executable] = socket_path
             else:
                 logger.error(f"Unknown argument {opt[0]}")
         if len(args) != 1:
@@ -152,10 +202,10 @@ def select_valid(versions: list) -> list:
     return [version for version in versions if version['_explicit_validity']]
 
 
-def invoke_check_tool(exe, args, env, cwd):
+def invoke_check_tool(exe, args, env, cwd, socket_path=None):
     """run check tool and return invokation dict to use in the report"""
     try:
-        compl = run_check_tool(exe, args, env, cwd)
+        compl = run_check_tool(exe, args, env, cwd, socket_path)
     except Exception as e:
         invokation = {
             "rc": 127,
@@ -196,15 +246,17 @@ def compute_results(stdout, permissible_ids=()):
 
 
 class CheckRunner:
-    def __init__(self, cwd, assignment, verbosity=0):
+    def __init__(self, cwd, assignment, verbosity=0, dispatch=None):
         self.cwd = cwd
         self.assignment = assignment
+        self.dispatch = dispatch or {}
         self.num_abort = 0
         self.num_error = 0
         self.verbosity = verbosity
         self.spamminess = 0
 
-    def run(self, check, testcases=()):
+    def invoke(self, check, testcases=()):
+        """run `check` and return invocation dict; doesn't touch any state, so it's safe to use in threads"""
         parameters = check.get('parameters', {})
         assignment = {'testcases': ' '.join(testcases), **self.assignment, **parameters}
         args = check.get('args', '').format(**assignment)
@@ -213,13 +265,18 @@ class CheckRunner:
         cmd = f"{env_str} {check['executable']} {args}".strip()
         logger.debug(f"running {cmd!r}...")
         check_env = {**os.environ, **env}
-        invocation = invoke_check_tool(check["executable"], args, check_env, self.cwd)
-        invocation = {
+        executable = check["executable"]
+        socket_path = self.dispatch.get(executable) or self.dispatch.get(os.path.basename(executable))
+        invocation = invoke_check_tool(executable, args, check_env, self.cwd, socket_path)
+        return {
             'id': str(uuid.uuid4()),
             'cmd': cmd,
             'results': compute_results(invocation['stdout'], permissible_ids=testcases),
             **invocation
         }
+
+    def record(self, invocation):
+        """output `invocation` according to verbosity and update counters; returns `invocation`"""
         if self.verbosity > 1 and invocation["stdout"]:
             print("\n".join(invocation["stdout"]))
             self.spamminess += 1
@@ -234,6 +291,62 @@ class CheckRunner:
         self.num_error += len([value for value in invocation['results'].values() if value < 0])
         return invocation
 
+    def run(self, check, testcases=()):
+        return self.record(self.invoke(check, testcases))
+
+    def run_all(self, checks, jobs=1):
+        """run `checks` (pairs of check and testcases), up to `jobs` of them concurrently
+
+        Invocations are recorded (and returned) in the order given, regardless of the order of completion,
+        so output and report are the same as with sequential execution.
+        """
+        if jobs <= 1 or len(checks) <= 1:
+            return [self.run(check, testcases) for check, testcases in checks]
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(self.invoke, check, testcases) for check, testcases in checks]
+            return [self.record(future.result()) for future in futures]
+
+
+def load_reusable_invocations(path, spec, subject, testcase_ids, now):
+    """read report from `path` and return those of its results for `testcase_ids` that are valid at `now`
+
+    The return value maps invocation ids to invocations as found in the report, except that `results` is
+    restricted to the reusable ones, that the captured output is omitted (along with the counts derived
+    from it), and that the fields `checked_at` and `reused_from` (uuid of the report that the results
+    originally stem from) are added. Only passing results are reused, so that failed or aborted testcases
+    are checked again.
+    """
+    with open(path, "r", encoding="UTF-8") as fileobj:
+        report = yaml.safe_load(fileobj)
+    if report['spec']['uuid'] != spec['uuid']:
+        raise RuntimeError(f"Previous report {path} is for a different spec: {report['spec']['name']}")
+    if report['subject'] != subject:
+        raise RuntimeError(f"Previous report {path} is for a different subject: {report['subject']}")
+    testcase_lookup = spec['testcases']
+    invocations = report['run']['invocations']
+    reused = {}
+    for inv_id, invocation in invocations.items():
+        # results from an earlier incremental run carry their own timestamp
+        checked_at = invocation.get('checked_at', report['checked_at'])
+        results = {
+            tc_id: value
+            for tc_id, value in invocation['results'].items()
+            if tc_id in testcase_ids and value == 1 and now < add_period(checked_at, testcase_lookup[tc_id].get('lifetime'))
+        }
+        if not results:
+            continue
+        # the output may concern testcases that are not reused, so don't copy it; see the original report
+        reused[inv_id] = {
+            **invocation,
+            'results': results,
+            'stdout': [],
+            'stderr': [],
+            **{signal: 0 for signal in ('info', 'warning', 'error', 'critical')},
+            'checked_at': checked_at,
+            'reused_from': invocation.get('reused_from', report['run']['uuid']),
+        }
+    return reused
+
 
 def print_report(testcase_lookup: dict, targets: dict, results: dict, partial=False, verbose=False):
     for tname, tc_ids in targets.items():
@@ -288,6 +401,7 @@ def create_report(argv, config, spec, invocations):
             "sections": config.sections,
             "forced_version": config.version or None,
             "forced_tests": None if config.tests is None else config.tests.pattern,
+            "incremental": config.incremental,
             "invocations": {invocation['id']: invocation for invocation in invocations},
         },
     }
@@ -318,7 +432,9 @@ def main(argv):
     if not versions:
         raise RuntimeError(f"No valid version found for {config.checkdate}")
     check_cwd = os.path.dirname(config.arg0) or os.getcwd()
-    runner = CheckRunner(check_cwd, assignment, verbosity=config.verbose and 2 or not config.quiet)
+    runner = CheckRunner(
+        check_cwd, assignment, verbosity=config.verbose and 2 or not config.quiet, dispatch=config.dispatch,
+    )
     title, partial = spec['name'], False
     if config.sections:
         title += f" [sections: {', '.join(config.sections)}]"
@@ -345,12 +461,23 @@ def main(argv):
             continue
         idx = script['_idx']
         script_tc_ids[idx].append(tc_id)
+    # with --incremental, skip testcases whose previous result is still valid
+    reused = {}
+    if config.incremental:
+        reused = load_reusable_invocations(
+            config.incremental, spec, config.subject, set(chain.from_iterable(script_tc_ids)),
+            datetime.datetime.now(),
+        )
+        reused_ids = set(chain.from_iterable(invocation['results'] for invocation in reused.values()))
+        logger.info(f"reusing {len(reused_ids)} results from {config.incremental}")
+        script_tc_ids = [[tc_id for tc_id in tc_ids if tc_id not in reused_ids] for tc_ids in script_tc_ids]
     # run scripts
-    invocations = [
-        runner.run(script, testcases=sorted(tc_ids))
+    invocations = runner.run_all([
+        (script, sorted(tc_ids))
         for script, tc_ids in zip(spec['scripts'], script_tc_ids)
         if tc_ids
-    ]
+    ], jobs=config.jobs)
+    invocations.extend(reused.values())
     results = {}
     for invocation in invocations:
         results.update(invocation['results'])
@@ -5,11 +5,15 @@
 #
 # (c) Matthias Büchse <matthias.buechse@cloudandheat.com>
 # SPDX-License-Identifier: Apache-2.0
+import asyncio
 from datetime import date
+import heapq
+import json
 import logging
 import os
 import os.path
 import shutil
+import signal
 import subprocess
 import sys
 import tempfile
@@ -20,6 +24,12 @@ import tomli
 
 logger = logging.getLogger(__name__)
 MONITOR_URL = "https://compliance.sovereignit.cloud/"
+# number of seconds a job gets to terminate after SIGTERM (upon timeout) before it is killed
+KILL_GRACE_SECONDS = 30
+# file (relative to the config file) to keep durations of previous test jobs, used to schedule the jobs
+STATE_FILE = '.runner-state.json'
+# weight of the most recent duration of a test job versus the previous estimate
+DURATION_SMOOTHING = 0.5
 
 
 def ensure_dir(path):
@@ -69,7 +79,7 @@ class Config:
     def abspath(self, path):
         return os.path.join(self.cwd, path)
 
-    def build_check_command(self, scope, subject, sections, output):
+    def build_check_command(self, scope, subject, sections, output, dispatch=()):
         # TODO figure out when to supply --debug here (but keep separated from our --debug)
         args = [
             sys.executable, self.scs_compliance_check, self.abspath(self.scopes[scope]['spec']),
@@ -77,6 +87,8 @@ class Config:
         ]
         if sections:
             args.extend(['--sections', sections])
+        for item in dispatch:
+            args.extend(['--dispatch', item])
         for key, value in self.get_subject_mapping(subject).items():
             args.extend(['-a', f'{key}={value}'])
         return {'args': args}
@@ -147,13 +159,100 @@ def process_pipeline(rc, *args, **kwargs):
     sys.exit(rc)
 
 
-def _run_commands(commands, num_workers=5):
-    processes = []
-    while commands or processes:
-        while commands and len(processes) < num_workers:
-            processes.append(subprocess.Popen(**commands.pop()))
-        processes[:] = [p for p in processes if p.poll() is None]
-        time.sleep(0.5)
+def _signal_group(proc, sig):
+    """send `sig` to the process group of `proc` (which must have been started in a new session)"""
+    try:
+        os.killpg(proc.pid, sig)
+    except ProcessLookupError:
+        pass  # all processes of the group are gone
+
+
+async def _run_command(command, semaphore, timeout=None):
+    async with semaphore:
+        start = time.monotonic()
+        try:
+            # use a new session (hence, process group), so that we can signal grandchildren as well
+            # (such as openstack_test.py started by the compliance check, which may hold cloud resources)
+            proc = await asyncio.create_subprocess_exec(
+                *command['args'], cwd=command.get('cwd'), start_new_session=True,
+            )
+        except OSError as exc:
+            logger.error(f"could not start {command['args'][0]}: {exc!r}")
+            return {'rc': None, 'duration': 0.0, 'timed_out': False}
+        timed_out = False
+        try:
+            await asyncio.wait_for(proc.wait(), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            _signal_group(proc, signal.SIGTERM)
+            try:
+                await asyncio.wait_for(proc.wait(), KILL_GRACE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            # kill whatever is left, including grandchildren that may outlive the child
+            _signal_group(proc, signal.SIGKILL)
+            await proc.wait()
+        except asyncio.CancelledError:
+            # the new session doesn't get the SIGINT from the terminal, so pass on the interruption
+            _signal_group(proc, signal.SIGTERM)
+            raise
+        return {'rc': proc.returncode, 'duration': time.monotonic() - start, 'timed_out': timed_out}
+
+
+async def _run_commands_async(commands, num_workers, timeout):
+    # the semaphore serves waiters in FIFO order, so the commands are started in the given order
+    semaphore = asyncio.Semaphore(num_workers)
+    return await asyncio.gather(*[_run_command(command, semaphore, timeout) for command in commands])
+
+
+def _run_commands(commands, num_workers=5, timeout=None):
+    """run `commands` with at most `num_workers` at the same time, return list of results (in order)
+
+    Each command is a dict with key `args` and optional key `cwd`. Each result is a dict with keys `rc`
+    (None if the command could not be started), `duration` (wall time in seconds), and `timed_out`.
+    A command that takes longer than `timeout` seconds (if given) is terminated.
+    """
+    results = asyncio.run(_run_commands_async(commands, num_workers, timeout))
+    for command, result in zip(commands, results):
+        if result['timed_out']:
+            logger.error(f"timed out after {result['duration']:.1f} s: {' '.join(command['args'])}")
+        elif result['rc']:
+            logger.debug(f"exit code {result['rc']} after {result['duration']:.1f} s: {' '.join(command['args'])}")
+    return results
+
+
+def _is_failure(result):
+    return result['timed_out'] or result['rc'] != 0
+
+
+def _load_state(path):
+    try:
+        with open(path, 'r') as fileobj:
+            return json.load(fileobj)
+    except FileNotFoundError:
+        return {}
+    except ValueError as exc:
+        logger.warning(f'ignoring malformed state file {path}: {exc!r}')
+        return {}
+
+
+def _save_state(path, state):
+    with open(f'{path}.tmp', 'w') as fileobj:
+        json.dump(state, fileobj, indent=2, sort_keys=True)
+    _move_file(f'{path}.tmp', path)
+
+
+def _duration_key(scope, subject, sections):
+    return f'{scope}/{subject}/{sections or ""}'
+
+
+def _predict_makespan(durations, num_workers):
+    """return the total wall time when running jobs with `durations` in the given order on `num_workers` slots"""
+    slots = [0.0] * min(num_workers, len(durations))
+    for duration in durations:
+        # the next job goes to the slot that becomes free first
+        heapq.heapreplace(slots, slots[0] + duration)
+    return max(slots, default=0.0)
 
 
 def _concat_files(source_paths, target_path):
@@ -179,12 +278,20 @@ def _move_file(source_path, target_path):
 @click.option('--section', 'sections', type=str)
 @click.option('--preset', 'preset', type=str)
 @click.option('--num-workers', 'num_workers', type=int, default=5)
+@click.option('--timeout', 'timeout', type=float, default=None, help='maximum number of seconds per test job')
 @click.option('--monitor-url', 'monitor_url', type=str, default=MONITOR_URL)
 @click.option('-o', '--output', 'report_yaml', type=click.Path(exists=False), default=None)
+@click.option('--state-file', 'state_file', type=click.Path(dir_okay=False), default=None)
+@click.option('--dispatch', 'dispatch', type=str, multiple=True, help='EXECUTABLE=SOCKET, see scs-compliance-check.py')
 @click.pass_obj
-def run(cfg, scopes, subjects, sections, preset, num_workers, monitor_url, report_yaml):
+def run(cfg, scopes, subjects, sections, preset, num_workers, timeout, monitor_url, report_yaml, state_file, dispatch):
     """
     run compliance tests and upload results to compliance monitor
+
+    The jobs are started longest first, going by the durations of previous runs (as kept in the state file).
+
+    Exits with non-zero code if a test job timed out or did not produce a report, or if the upload failed.
+    (A test job that merely reports failed testcases is not considered a failure of the runner.)
     """
     if not scopes and not subjects and not preset:
         preset = 'default'
@@ -195,6 +302,7 @@ def run(cfg, scopes, subjects, sections, preset, num_workers, monitor_url, repor
         scopes = preset_dict['scopes']
         subjects = preset_dict['subjects']
         num_workers = preset_dict.get('workers', num_workers)
+        timeout = preset_dict.get('timeout', timeout)
     else:
         scopes = [scope.strip() for scope in scopes.split(',')] if scopes else []
         subjects = [subject.strip() for subject in subjects.split(',')] if subjects else []
@@ -216,19 +324,54 @@ def run(cfg, scopes, subjects, sections, preset, num_workers, monitor_url, repor
         report_yaml_tmp = os.path.join(tdirname, 'report.yaml')
         jobs = [(scope, subject) for scope in scopes for subject in subjects]
         outputs = [os.path.join(tdirname, f'report-{idx}.yaml') for idx in range(len(jobs))]
-        commands = [cfg.build_check_command(job[0], job[1], sections, output) for job, output in zip(jobs, outputs)]
-        _run_commands(commands, num_workers=num_workers)
-        _concat_files(outputs, report_yaml_tmp)
+        commands = [
+            cfg.build_check_command(job[0], job[1], sections, output, dispatch)
+            for job, output in zip(jobs, outputs)
+        ]
+        # schedule longest (expected) processing time first; assume that unknown jobs are as long as the longest
+        state_path = state_file or cfg.abspath(STATE_FILE)
+        state = _load_state(state_path)
+        known_durations = state.setdefault('durations', {})
+        keys = [_duration_key(scope, subject, sections) for scope, subject in jobs]
+        default_duration = max(known_durations.values(), default=0.0)
+        expected = [known_durations.get(key, default_duration) for key in keys]
+        order = sorted(range(len(jobs)), key=lambda idx: -expected[idx])
+        start = time.monotonic()
+        ordered_results = _run_commands([commands[idx] for idx in order], num_workers=num_workers, timeout=timeout)
+        makespan = time.monotonic() - start
+        results = [None] * len(jobs)
+        for idx, result in zip(order, ordered_results):
+            results[idx] = result
+        predicted = _predict_makespan([expected[idx] for idx in order], num_workers)
+        logger.info(f'makespan: {makespan:.0f} s (predicted: {predicted:.0f} s)')
+        rc = 0
+        for (scope, subject), key, output, result in zip(jobs, keys, outputs, results):
+            status = 'timed out' if result['timed_out'] else f"exit code {result['rc']}"
+            logger.info(f"{scope} {subject}: {status}, {result['duration']:.1f} s")
+            if result['rc'] is not None:
+                previous = known_durations.get(key, result['duration'])
+                known_durations[key] = (
+                    DURATION_SMOOTHING * result['duration'] + (1 - DURATION_SMOOTHING) * previous
+                )
+            if result['timed_out'] or not os.path.exists(output):
+                logger.error(f"{scope} {subject}: no report")
+                rc = 1
+        _save_state(state_path, state)
+        _concat_files([output for output in outputs if os.path.exists(output)], report_yaml_tmp)
         if report_yaml is None:
             report_yaml = report_yaml_tmp
         else:
             _move_file(report_yaml_tmp, report_yaml)
-        subprocess.run(**cfg.build_sign_command(report_yaml))
-        subprocess.run(**cfg.build_upload_command(report_yaml, monitor_url))
-    return 0
+        if subprocess.run(**cfg.build_sign_command(report_yaml)).returncode:
+            logger.error('signing the report failed')
+            return 1
+        if subprocess.run(**cfg.build_upload_command(report_yaml, monitor_url)).returncode:
+            logger.error('uploading the report failed')
+            return 1
+    return rc
 
 
-def _run_command_for_subjects(cfg, subjects, preset, num_workers, command):
+def _run_command_for_subjects(cfg, subjects, preset, num_workers, command, timeout=None):
     if not subjects and not preset:
         preset = 'default'
     if preset:
@@ -237,6 +380,7 @@ def _run_command_for_subjects(cfg, subjects, preset, num_workers, command):
             raise KeyError('preset not found')
         subjects = preset_dict['subjects']
         num_workers = preset_dict.get('workers', num_workers)
+        timeout = preset_dict.get('timeout', timeout)
     else:
         subjects = [subject.strip() for subject in subjects.split(',')] if subjects else []
     if not subjects:
@@ -244,7 +388,11 @@ def _run_command_for_subjects(cfg, subjects, preset, num_workers, command):
     logger.debug(f'running {command} for subject(s) {", ".join(subjects)}, num_workers: {num_workers}')
     m = getattr(cfg, f'build_{command}_command')
     commands = [m(subject) for subject in subjects]
-    _run_commands(commands, num_workers=num_workers)
+    results = _run_commands(commands, num_workers=num_workers, timeout=timeout)
+    failed = [subject for subject, result in zip(subjects, results) if _is_failure(result)]
+    if failed:
+        logger.error(f'{command} failed for subject(s) {", ".join(failed)}')
+        return 1
     return 0
 
 
@@ -252,36 +400,39 @@ def _run_command_for_subjects(cfg, subjects, preset, num_workers, command):
 @click.option('--subject', 'subjects', type=str)
 @click.option('--preset', 'preset', type=str)
 @click.option('--num-workers', 'num_workers', type=int, default=5)
+@click.option('--timeout', 'timeout', type=float, default=None, help='maximum number of seconds per subject')
 @click.pass_obj
-def cleanup(cfg, subjects, preset, num_workers):
+def cleanup(cfg, subjects, preset, num_workers, timeout):
     """
     clean up any lingering IaaS resources
     """
-    return _run_command_for_subjects(cfg, subjects, preset, num_workers, "cleanup")
+    return _run_command_for_subjects(cfg, subjects, preset, num_workers, "cleanup", timeout=timeout)
 
 
 @cli.command()
 @click.option('--subject', 'subjects', type=str)
 @click.option('--preset', 'preset', type=str)
 @click.option('--num-workers', 'num_workers', type=int, default=5)
+@click.option('--timeout', 'timeout', type=float, default=None, help='maximum number of seconds per subject')
 @click.pass_obj
-def provision(cfg, subjects, preset, num_workers):
+def provision(cfg, subjects, preset, num_workers, timeout):
     """
     create k8s clusters
     """
-    return _run_command_for_subjects(cfg, subjects, preset, num_workers, "provision")
+    return _run_command_for_subjects(cfg, subjects, preset, num_workers, "provision", timeout=timeout)
 
 
 @cli.command()
 @click.option('--subject', 'subjects', type=str)
 @click.option('--preset', 'preset', type=str)
 @click.option('--num-workers', 'num_workers', type=int, default=5)
+@click.option('--timeout', 'timeout', type=float, default=None, help='maximum number of seconds per subject')
 @click.pass_obj
-def unprovision(cfg, subjects, preset, num_workers):
+def unprovision(cfg, subjects, preset, num_workers, timeout):
     """
     clean up k8s clusters
     """
-    return _run_command_for_subjects(cfg, subjects, preset, num_workers, "unprovision")
+    return _run_command_for_subjects(cfg, subjects, preset, num_workers, "unprovision", timeout=timeout)
 
 
 if __name__ == '__main__':
@@ -6,6 +6,7 @@
 # (c) Matthias Büchse <matthias.buechse@cloudandheat.com>
 # SPDX-License-Identifier: Apache-2.0
 
+from bisect import bisect_right
 from collections import defaultdict
 from datetime import datetime, date, timedelta
 import logging
@@ -111,6 +112,8 @@ def _resolve_spec(spec: dict):
         for vname in entry['versions']:
             # trigger KeyError
             _ = version_lookup[vname]
+    # precompute the timeline so validity can be looked up for any date (see `lookup_validity`)
+    spec['_timeline'] = compile_timeline(spec['timeline'])
     # step 5. unify variables declaration (the list may contain strings as well as singleton dicts)
     variables = []
     defaults = {}
@@ -133,13 +136,27 @@ def load_spec(document: dict) -> dict:
     return document
 
 
-def annotate_validity(timeline: list, versions: dict, checkdate: date):
-    """annotate `versions` with validity info from `timeline` (note that this depends on `checkdate`)"""
-    validity_lookup = max(
-        (entry for entry in timeline if entry['date'] <= checkdate),
-        key=lambda entry: entry['date'],
-        default={},
-    ).get('versions', {})
+def compile_timeline(timeline: list) -> tuple:
+    """convert `timeline` into a pair of lists (dates, validity lookups), sorted by date"""
+    entries = sorted(timeline, key=lambda entry: entry['date'])
+    return [entry['date'] for entry in entries], [entry['versions'] for entry in entries]
+
+
+def lookup_validity(compiled_timeline: tuple, checkdate: date) -> dict:
+    """return mapping from version name to validity as of `checkdate` (using bisection)"""
+    dates, validity_lookups = compiled_timeline
+    idx = bisect_right(dates, checkdate)
+    return validity_lookups[idx - 1] if idx else {}
+
+
+def annotate_validity(timeline, versions: dict, checkdate: date):
+    """annotate `versions` with validity info from `timeline` (note that this depends on `checkdate`)
+
+    Here, `timeline` may be given as a list (as in the spec) or in compiled form (see `compile_timeline`).
+    """
+    if isinstance(timeline, list):
+        timeline = compile_timeline(timeline)
+    validity_lookup = lookup_validity(timeline, checkdate)
     for vname, version in versions.items():
         validity = validity_lookup.get(vname)
         version['validity'] = validity or 'deprecated'
@@ -0,0 +1,41 @@
+"""
+Pytest based unit tests for scs_cert_lib.
+
+SPDX-License-Identifier: Apache-2.0
+"""
+
+from datetime import date
+
+import pytest
+
+from scs_cert_lib import annotate_validity, compile_timeline, lookup_validity
+
+
+TIMELINE = [
+    {'date': date(2025, 9, 9), 'versions': {'v2': 'effective', 'v1': 'deprecated'}},
+    {'date': date(2025, 1, 1), 'versions': {'v2': 'draft', 'v1': 'effective'}},
+    {'date': date(2025, 6, 1), 'versions': {'v2': 'effective', 'v1': 'warn'}},
+]
+
+
+@pytest.mark.parametrize("checkdate, expected", [
+    (date(2024, 12, 31), {}),
+    (date(2025, 1, 1), {'v2': 'draft', 'v1': 'effective'}),
+    (date(2025, 5, 31), {'v2': 'draft', 'v1': 'effective'}),
+    (date(2025, 6, 1), {'v2': 'effective', 'v1': 'warn'}),
+    (date(2030, 1, 1), {'v2': 'effective', 'v1': 'deprecated'}),
+])
+def test_lookup_validity(checkdate, expected):
+    assert lookup_validity(compile_timeline(TIMELINE), checkdate) == expected
+
+
+def test_annotate_validity():
+    versions = {'v1': {}, 'v2': {}, 'v3': {}}
+    annotate_validity(TIMELINE, versions, date(2025, 7, 1))
+    assert versions['v1'] == {'validity': 'warn', '_explicit_validity': 'warn'}
+    assert versions['v2'] == {'validity': 'effective', '_explicit_validity': 'effective'}
+    assert versions['v3'] == {'validity': 'deprecated', '_explicit_validity': None}
+    # compiled form must give the same result
+    versions2 = {'v1': {}, 'v2': {}, 'v3': {}}
+    annotate_validity(compile_timeline(TIMELINE), versions2, date(2025, 7, 1))
+    assert versions2 == versions
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Benchmark for the evaluation of historical ("as-of") compliance status
+
+Generates one year of synthetic daily results for a number of subjects and evaluates the status for each
+day of that year, once naively (filtering all rows for each day, as an as-of query per day would) and once
+using the single sweep of `convert_result_rows_to_series2`, as done by the endpoint `/status/history`.
+
+Note that this only measures the evaluation in Python; the database query is supported by the index
+`result2_subject_scope_checked_at` (schema version v5).
+
+Usage: run from the directory compliance-monitor, e.g., `python3 benchmarks/bench_history.py`
+"""
+from datetime import datetime, timedelta
+import time
+
+from common import load_scopes, make_rows, run
+from monitor import SCOPE_ALIASES, convert_result_rows_to_dict2, convert_result_rows_to_series2
+
+
+def main(num_subjects=10, days=365):
+    scopes = load_scopes()
+    scopeuuid = SCOPE_ALIASES['scs-compatible-iaas']
+    subjects = [f'subject-{idx}' for idx in range(num_subjects)]
+    rows = make_rows(scopes[scopeuuid], subjects, days=days)
+    start = rows[0][5].date()
+    dates = [start + timedelta(days=n) for n in range(days)]
+    print(f'{len(rows)} rows, {len(subjects)} subjects, {len(dates)} dates')
+
+    t0 = time.perf_counter()
+    series = convert_result_rows_to_series2(rows, scopes, subjects, scopeuuid, dates)
+    t1 = time.perf_counter()
+    print(f'sweep: {t1 - t0:.3f} s ({len(series)} data points)')
+
+    # naive approach: evaluate all rows checked before the end of each day (restricted to a sample of days
+    # because this takes long; extrapolate to the full range)
+    sample = dates[::30]
+    t0 = time.perf_counter()
+    for checkdate in sample:
+        until = datetime.combine(checkdate, datetime.min.time()) + timedelta(days=1)
+        convert_result_rows_to_dict2(
+            [row for row in rows if row[5] < until], scopes,
+            subjects=subjects, scopes=(scopeuuid, ), checkdate=checkdate,
+        )
+    t1 = time.perf_counter()
+    print(f'naive: {(t1 - t0) * len(dates) / len(sample):.3f} s (extrapolated from {len(sample)} dates)')
+
+
+if __name__ == "__main__":
+    run(main)
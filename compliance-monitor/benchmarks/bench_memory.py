@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Benchmark for the peak memory of evaluating all current results (as done for the table view)
+
+Populates the database with one report per synthetic subject (with a result for every testcase of the
+IaaS scope), then queries the current results via `db_get_relevant_results2` and evaluates them via
+`convert_result_rows_to_dict2`, once using an ordinary cursor and `fetchall()`, and once using a named
+(server-side) cursor, see `scan_cursor`. Each variant runs in a subprocess of its own, so the peak RSS
+(which includes the memory held by libpq) can be compared.
+
+CAUTION: synthetic subjects (named `bench-*`) are inserted into the database, so only use a throwaway
+database! With `--docker`, a throwaway Postgres container is started (and stopped afterwards);
+otherwise, the database is given by the environment variables `SCM_DB_HOST` etc. as usual.
+
+Usage: run from the directory compliance-monitor, e.g., `python3 benchmarks/bench_memory.py --docker 2000`
+"""
+from itertools import groupby
+import resource
+import subprocess
+import sys
+import time
+
+from common import load_scopes, make_rows
+
+SUBJECT_PREFIX = 'bench-'
+
+
+def max_rss_mib():
+    # ru_maxrss is given in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def counted(rows, counter):
+    """yield `rows`, counting them in `counter` (a list with one element)"""
+    for row in rows:
+        counter[0] += 1
+        yield row
+
+
+def populate(conn, spec, num_subjects):
+    """replace synthetic subjects in the database by `num_subjects` new ones, each with a report for `spec`"""
+    from psycopg2.extras import execute_values
+    from sql import db_insert_report
+    subjects = [f'{SUBJECT_PREFIX}{idx}' for idx in range(num_subjects)]
+    with conn.cursor() as cur:
+        cur.execute('DELETE FROM result2 WHERE subject LIKE %s;', (f'{SUBJECT_PREFIX}%', ))
+        cur.execute('DELETE FROM report WHERE subject LIKE %s;', (f'{SUBJECT_PREFIX}%', ))
+        for report_uuid, rows in groupby(make_rows(spec, subjects), key=lambda row: row[6]):
+            rows = list(rows)
+            subject, checked_at = rows[0][0], rows[0][5]
+            reportid = db_insert_report(cur, report_uuid, checked_at, subject, '{}')
+            execute_values(cur, '''
+            INSERT INTO result2 (checked_at, subject, scopeuuid, version, testcase, result, approval, reportid)
+            VALUES %s;''', [
+                (checked_at, subject, scopeuuid, version, tc_id, result, result == 1, reportid)
+                for subject, scopeuuid, version, tc_id, result, checked_at, _ in rows
+            ])
+    conn.commit()
+
+
+def run_variant(variant):
+    from monitor import SCOPE_ALIASES, convert_result_rows_to_dict2, mk_conn, scan_cursor
+    from sql import db_get_relevant_results2
+    scopes = load_scopes()
+    scopeuuid = SCOPE_ALIASES['scs-compatible-iaas']
+    conn = mk_conn()
+    baseline = max_rss_mib()
+    t0 = time.perf_counter()
+    if variant == 'fetchall':
+        with conn.cursor() as cur:
+            db_get_relevant_results2(cur, scopeuuid=scopeuuid)
+            rows = cur.fetchall()
+            num_rows = len(rows)
+            results = convert_result_rows_to_dict2(rows, scopes, include_report=True)
+    else:
+        counter = [0]
+        with scan_cursor(conn, 'bench') as cur:
+            results = convert_result_rows_to_dict2(
+                counted(db_get_relevant_results2(cur, scopeuuid=scopeuuid), counter), scopes, include_report=True,
+            )
+        num_rows = counter[0]
+    t1 = time.perf_counter()
+    conn.close()
+    print(
+        f'{variant}: {num_rows} rows, {len(results)} subjects, {t1 - t0:.3f} s, '
+        f'peak RSS {max_rss_mib():.1f} MiB (baseline {baseline:.1f} MiB)'
+    )
+
+
+def run(num_subjects):
+    from monitor import SCOPE_ALIASES, mk_conn
+    from sql import db_ensure_schema
+    scopes = load_scopes()
+    with mk_conn() as conn:
+        db_ensure_schema(conn)
+        populate(conn, scopes[SCOPE_ALIASES['scs-compatible-iaas']], num_subjects)
+    for variant in ('fetchall', 'scan'):
+        subprocess.run([sys.executable, __file__, '--variant', variant], check=True)
+
+
+def main(argv):
+    if argv[:1] == ['--variant']:
+        return run_variant(argv[1])
+    docker = argv[:1] == ['--docker']
+    num_subjects = int(argv[docker]) if len(argv) > docker else 2000
+    if not docker:
+        return run(num_subjects)
+    from loadtest import postgres_container, wait_for_postgres
+    with postgres_container():
+        wait_for_postgres()
+        run(num_subjects)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
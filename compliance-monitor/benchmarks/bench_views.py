@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Benchmark for the rendering of the details view
+
+Renders the details fragment for a scope with 60 testcases (synthetic results for a few subjects) in three
+ways: via the Markdown template and subsequent conversion to HTML, the same with the conversion taken from
+its cache (as done for the page once the fragment has been rendered, or vice versa), and from the view cache
+(as done for repeated requests within one data generation).
+
+Usage: run from the directory compliance-monitor, e.g., `python3 benchmarks/bench_views.py`
+"""
+import time
+
+from common import load_scopes, make_rows, run
+import monitor
+from monitor import (
+    SCOPE_ALIASES, VIEW_DETAIL, ViewType, cached_view, convert_result_rows_to_dict2, env, import_templates,
+    markdown_to_html, register_filters, render_view, settings, templates_map,
+)
+
+
+def measure(label, func, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    t1 = time.perf_counter()
+    print(f'{label}: {(t1 - t0) * 1000 / repeat:.3f} ms per request')
+
+
+def main(num_subjects=3, repeat=200):
+    monitor._scopes.update(load_scopes())
+    register_filters(env)
+    import_templates(settings.template_path, env, templates_map)
+    scopeuuid = SCOPE_ALIASES['scs-compatible-iaas']
+    subjects = [f'subject-{idx}' for idx in range(num_subjects)]
+    rows = make_rows(monitor.get_scopes()[scopeuuid], subjects, num_testcases=60)
+    results = convert_result_rows_to_dict2(
+        rows, monitor.get_scopes(), include_report=True, subjects=subjects, scopes=(scopeuuid, ),
+    )
+    print(f'{len(rows)} rows, {len(subjects)} subjects')
+
+    def render():
+        return render_view(VIEW_DETAIL, ViewType.fragment, results=results, base_url='/', title='bench')
+
+    def render_uncached():
+        markdown_to_html.cache_clear()
+        return render()
+
+    def render_cached():
+        return cached_view(('bench', ViewType.fragment), render)
+
+    measure('markdown', render_uncached, repeat)
+    measure('markdown (conversion cached)', render, repeat)
+    measure('view cache', render_cached, repeat)
+
+
+if __name__ == "__main__":
+    run(main)
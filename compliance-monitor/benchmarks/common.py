@@ -0,0 +1,44 @@
+"""Fixture shared by the micro benchmarks in this directory
+
+Importing this module makes the modules of the compliance monitor importable.
+"""
+from datetime import datetime, timedelta
+import os.path
+import random
+import sys
+
+MONITOR_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, MONITOR_DIR)
+
+
+def load_scopes():
+    """return dict of scopes (see `import_cert_yaml_dir`) as given by the spec files in `Tests`"""
+    from monitor import import_cert_yaml_dir, settings
+    scopes = {}
+    import_cert_yaml_dir(settings.yaml_path, scopes)
+    return scopes
+
+
+def make_rows(spec, subjects, days=1, num_testcases=None, seed=0):
+    """generate rows as returned by `db_get_relevant_results2`, oldest first
+
+    There is one report per subject and day, for each of the last `days` days (the latest one an hour ago),
+    each with a result for every testcase of `spec` (or only the first `num_testcases` ones).
+    """
+    rng = random.Random(seed)
+    testcases = list(spec['testcases'])[:num_testcases]
+    now = datetime.now()
+    rows = []
+    for offset in range(days):
+        checked_at = now - timedelta(days=days - 1 - offset, hours=1)
+        for subject in subjects:
+            report_uuid = f'{subject}-{offset}'
+            for tc_id in testcases:
+                result = rng.choices((1, 0, -1), weights=(90, 5, 5))[0]
+                rows.append((subject, spec['uuid'], '*', tc_id, result, checked_at, report_uuid))
+    return rows
+
+
+def run(main):
+    """call `main` with the command-line arguments, which must be integers"""
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""Load test for the compliance monitor
+
+Stands up the service against a local Postgres, populates the database with synthetic subjects and
+months of daily reports (for the scopes given by `Tests/scs-compatible-*.yaml`), and then measures
+throughput as well as latency percentiles for the most important endpoints:
+
+- GET /page/table
+- GET /page/detail/{subject}/{scopeuuid}
+- GET /status
+- POST /reports (the ingestion itself happens asynchronously; its throughput is measured as well)
+- POST /results
+
+The results are written to a JSON file (along with the parameters and the current git commit), so
+they can be compared across commits.
+
+CAUTION: the database will be populated (and the bootstrap data replaced), so only use a throwaway
+database! With `--docker`, a throwaway Postgres container is started (and stopped afterwards);
+otherwise, the database is given by the environment variables `SCM_DB_HOST` etc. as usual.
+
+Usage (from the directory compliance-monitor, for instance):
+`python3 benchmarks/loadtest.py --docker --subjects 20 --days 90 --output loadtest.json`
+"""
+import argparse
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import io
+import json
+import math
+import os
+import os.path
+import random
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import ruamel.yaml
+
+MONITOR_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, MONITOR_DIR)
+
+ADMIN = 'loadtest-admin'
+ADMIN_ROLES = ('read_any', 'append_any', 'admin', 'approve')
+SCOPES = ('scs-compatible-iaas', 'scs-compatible-kaas')
+DB_PASSWORD = 'loadtest'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_postgres(timeout=60):
+    import psycopg2
+    from monitor import mk_conn
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with mk_conn() as conn, conn.cursor() as cur:
+                cur.execute('SELECT 1;')
+            return
+        except psycopg2.OperationalError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1)
+
+
+@contextmanager
+def postgres_container():
+    """start throwaway Postgres container and point the environment variables `SCM_DB_*` to it"""
+    port = free_port()
+    name = f'scm-loadtest-{os.getpid()}'
+    subprocess.run([
+        'docker', 'run', '--rm', '-d', '--name', name, '-p', f'127.0.0.1:{port}:5432',
+        '-e', f'POSTGRES_PASSWORD={DB_PASSWORD}', 'postgres',
+    ], check=True, stdout=subprocess.DEVNULL)
+    os.environ.update(SCM_DB_HOST='127.0.0.1', SCM_DB_PORT=str(port), SCM_DB_PASSWORD=DB_PASSWORD)
+    try:
+        yield
+    finally:
+        subprocess.run(['docker', 'stop', name], stdout=subprocess.DEVNULL)
+
+
+def generate_ssh_key(workdir):
+    keyfile = os.path.join(workdir, 'id_ed25519')
+    subprocess.run(['ssh-keygen', '-q', '-t', 'ed25519', '-N', '', '-f', keyfile], check=True)
+    with open(f'{keyfile}.pub', 'r') as fileobj:
+        key_type, public_key, *_ = fileobj.read().split()
+    return keyfile, key_type, public_key
+
+
+def write_bootstrap(path, subjects, api_key_hash, key_type, public_key):
+    accounts = [{
+        'subject': ADMIN,
+        'api_keys': [api_key_hash],
+        'keys': [{'public_key': public_key, 'public_key_type': key_type, 'public_key_name': 'loadtest'}],
+        'roles': list(ADMIN_ROLES),
+    }]
+    accounts.extend({'subject': subject, 'delegates': [ADMIN]} for subject in subjects)
+    with open(path, 'w') as fileobj:
+        ruamel.yaml.YAML(typ='safe').dump({'accounts': accounts}, fileobj)
+
+
+def make_report(spec, subject, checked_at, rng):
+    """create report as generated by scs-compliance-check.py, with random results for all testcases"""
+    results = {tc_id: rng.choices((1, 0, -1), weights=(90, 5, 5))[0] for tc_id in spec['testcases']}
+    invocation_id = str(uuid.uuid4())
+    return {
+        'spec': {'uuid': spec['uuid'], 'name': spec['name'], 'url': spec.get('url')},
+        'checked_at': checked_at.isoformat(),
+        'reference_date': checked_at.date().isoformat(),
+        'subject': subject,
+        'run': {
+            'uuid': str(uuid.uuid4()),
+            'argv': [],
+            'assignment': {},
+            'sections': None,
+            'forced_version': None,
+            'forced_tests': None,
+            'invocations': {invocation_id: {
+                'id': invocation_id,
+                'cmd': 'loadtest',
+                'results': results,
+                'rc': 0,
+                'stdout': [f'{tc_id}: {"PASS" if result == 1 else "FAIL"}' for tc_id, result in results.items()],
+                'stderr': [],
+                'info': 0,
+                'warning': 0,
+                'error': 0,
+                'critical': 0,
+            }},
+        },
+    }
+
+
+def populate(specs, subjects, days, seed=0):
+    """insert one report per subject, scope, and day via `ingest_reports`; return list of approval records"""
+    from monitor import ROLES, ingest_reports, mk_conn
+    rng = random.Random(seed)
+    account = (ADMIN, sum(ROLES[role] for role in ADMIN_ROLES))
+    start = datetime.now() - timedelta(days=days)
+    records = []
+    with mk_conn() as conn, conn.cursor() as cur:
+        for offset in range(days):
+            checked_at = start + timedelta(days=offset)
+            for subject in subjects:
+                for spec in specs:
+                    report = make_report(spec, subject, checked_at, rng)
+                    ingest_reports(cur, account, 'application/x-signed-json', json.dumps(report))
+                    if offset == days - 1:
+                        records.extend({
+                            'reportuuid': report['run']['uuid'], 'scopeuuid': spec['uuid'],
+                            'version': '*', 'check': tc_id, 'approval': True,
+                        } for tc_id in spec['testcases'])
+            conn.commit()
+    return records
+
+
+def dump_yaml(document):
+    stream = io.StringIO()
+    ruamel.yaml.YAML(typ='safe').dump(document, stream)
+    return stream.getvalue()
+
+
+def sign(keyfile, workdir, text):
+    path = os.path.join(workdir, 'report.yaml')
+    with open(path, 'w') as fileobj:
+        fileobj.write(text)
+    subprocess.run(['ssh-keygen', '-q', '-Y', 'sign', '-f', keyfile, '-n', 'report', path], check=True)
+    with open(f'{path}.sig', 'r') as fileobj:
+        signature = fileobj.read()
+    os.remove(f'{path}.sig')
+    # this is what curl does with two arguments `--data-binary` (see README)
+    return f'{signature}&{text}'.encode()
+
+
+@contextmanager
+def monitor_process(port, bootstrap_path):
+    proc = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', str(port), bootstrap_path], cwd=MONITOR_DIR,
+    )
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=5)
+                break
+            except (urllib.error.URLError, ConnectionError):
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("monitor did not come up")
+                time.sleep(0.5)
+        yield
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def serve(port, bootstrap_path):
+    import uvicorn
+    import monitor
+    monitor.settings.bootstrap_path = bootstrap_path
+    monitor.register_filters(monitor.env)
+    monitor.reload_static_config(do_ensure_schema=True)
+    uvicorn.run(monitor.app, host='127.0.0.1', port=port, log_level='warning', workers=1)
+
+
+def percentile(sorted_values, pct):
+    """nearest-rank percentile"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def measure(make_request, count, concurrency):
+    """issue `count` requests (`make_request(idx)` returns a `urllib.request.Request`), return statistics"""
+    def timed(idx):
+        request = make_request(idx)
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                response.read()
+            ok = True
+        except urllib.error.HTTPError as e:
+            e.read()
+            ok = False
+        return time.perf_counter() - t0, ok
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed, range(count)))
+    wall_time = time.perf_counter() - t0
+    latencies = sorted(latency * 1000 for latency, _ in outcomes)
+    return {
+        'count': count,
+        'errors': sum(1 for _, ok in outcomes if not ok),
+        'throughput_rps': round(count / wall_time, 2),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+    }
+
+
+def git_commit():
+    result = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=MONITOR_DIR, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def run(args, workdir):
+    wait_for_postgres()
+    import monitor
+    from monitor import SCOPE_ALIASES, cryptctx, get_scopes, import_cert_yaml_dir, mk_conn, settings
+    from sql import db_ensure_schema
+
+    subjects = [f'loadtest-{idx}' for idx in range(args.subjects)]
+    password = secrets.token_urlsafe(16)
+    keyfile, key_type, public_key = generate_ssh_key(workdir)
+    bootstrap_path = os.path.join(workdir, 'bootstrap.yaml')
+    write_bootstrap(bootstrap_path, subjects, cryptctx.hash(password), key_type, public_key)
+
+    # populate the database directly (much faster than via HTTP)
+    import_cert_yaml_dir(settings.yaml_path, monitor._scopes)
+    with mk_conn() as conn:
+        db_ensure_schema(conn)
+        monitor.import_bootstrap(bootstrap_path, conn=conn)
+    specs = [get_scopes()[SCOPE_ALIASES[scope]] for scope in SCOPES]
+    t0 = time.perf_counter()
+    records = populate(specs, subjects, args.days)
+    print(f'populated {len(subjects) * len(specs) * args.days} reports in {time.perf_counter() - t0:.1f} s')
+
+    rng = random.Random(1)
+    base_url = f'http://127.0.0.1:{args.port}/'
+    auth_header = 'Basic ' + base64.b64encode(f'{ADMIN}:{password}'.encode()).decode()
+    reports = [
+        sign(keyfile, workdir, dump_yaml(make_report(
+            specs[idx % len(specs)], subjects[idx % len(subjects)], datetime.now(), rng,
+        )))
+        for idx in range(args.requests)
+    ]
+
+    def get(path, **headers):
+        return lambda idx: urllib.request.Request(base_url + path(idx), headers=headers)
+
+    def post_report(idx):
+        return urllib.request.Request(f'{base_url}reports', data=reports[idx], method='POST', headers={
+            'Content-Type': 'application/x-signed-yaml', 'Authorization': auth_header,
+        })
+
+    def post_results(idx):
+        batch = rng.sample(records, min(10, len(records)))
+        body = [{**record, 'approval': bool(idx % 2)} for record in batch]
+        return urllib.request.Request(f'{base_url}results', data=json.dumps(body).encode(), method='POST', headers={
+            'Content-Type': 'application/json', 'Authorization': auth_header,
+        })
+
+    scopeuuids = [spec['uuid'] for spec in specs]
+    endpoints = {
+        'GET /page/table': get(lambda idx: 'page/table'),
+        'GET /page/detail': get(lambda idx: f'page/detail/{subjects[idx % len(subjects)]}/{scopeuuids[idx % 2]}'),
+        'GET /status': get(lambda idx: 'status', Accept='application/json'),
+        'POST /reports': post_report,
+        'POST /results': post_results,
+    }
+    results = {}
+    with monitor_process(args.port, bootstrap_path):
+        for name, make_request in endpoints.items():
+            results[name] = measure(make_request, args.requests, args.concurrency)
+            print(f'{name}: {results[name]}')
+            if name == 'POST /reports':
+                results['ingestion'] = wait_for_jobs(args.requests)
+                print(f'ingestion: {results["ingestion"]}')
+    return results
+
+
+def wait_for_jobs(count, timeout=600):
+    """wait until the ingestion queue is empty; return the time it took and the number of failed jobs"""
+    from monitor import mk_conn
+    t0 = time.perf_counter()
+    with mk_conn() as conn, conn.cursor() as cur:
+        while True:
+            cur.execute("SELECT count(*) FILTER (WHERE status = 'queued'), count(*) FILTER (WHERE status = 'failed') FROM job;")
+            queued, failed = cur.fetchone()
+            conn.rollback()
+            if not queued or time.perf_counter() - t0 > timeout:
+                break
+            time.sleep(0.1)
+    wait_time = time.perf_counter() - t0
+    return {'queued_after_posting_s': round(wait_time, 2), 'failed_jobs': failed, 'remaining_jobs': queued}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Load test for the compliance monitor")
+    parser.add_argument('--docker', action='store_true', help="start throwaway Postgres container")
+    parser.add_argument('--subjects', type=int, default=20, help="number of synthetic subjects")
+    parser.add_argument('--days', type=int, default=90, help="number of days of daily reports per subject and scope")
+    parser.add_argument('--requests', type=int, default=200, help="number of requests per endpoint")
+    parser.add_argument('--concurrency', type=int, default=8, help="number of concurrent clients")
+    parser.add_argument('--port', type=int, default=None, help="port for the monitor (default: any free one)")
+    parser.add_argument('--output', default='loadtest.json', help="path of the JSON file for the results")
+    args = parser.parse_args(argv)
+    args.output = os.path.abspath(args.output)
+    os.chdir(MONITOR_DIR)  # the monitor finds scopes and templates relative to the working directory
+    if args.port is None:
+        args.port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.docker:
+            with postgres_container():
+                results = run(args, workdir)
+        else:
+            results = run(args, workdir)
+    output = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(),
+        'parameters': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as fileobj:
+        json.dump(output, fileobj, indent=2)
+    print(f'results written to {args.output}')
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['--serve']:
+        serve(int(sys.argv[2]), sys.argv[3])
+    else:
+        main(sys.argv[1:])
@@ -12,10 +12,23 @@
 # to trigger a re-load. In any case, the `uvicorn.run` call would have to be
 # fundamentally changed:
 # > You must pass the application as an import string to enable 'reload' or 'workers'.
-from collections import defaultdict
+# Addendum: the ingestion of reports is done by `JobWorker` in a separate thread, which uses a database
+# connection of its own. This thread shares the scopes with the event loop (see `get_scopes`), and these
+# are modified twice: by `reload_static_config`, which replaces the dict as a whole (a single assignment),
+# and by `get_scopes` itself, which re-annotates the validity of versions when the day rolls over; both
+# do so while holding `_scopes_lock`. Templates and accounts are only used by the event loop.
+import asyncio
+from collections import defaultdict, OrderedDict
+from contextlib import asynccontextmanager
 from datetime import date, datetime, timedelta
 from enum import Enum
+from functools import lru_cache
+import csv
+import gzip
+import hashlib
+import io
 import json
+import math
 import logging
 import os
 import os.path
@@ -23,41 +36,57 @@ from shutil import which
 import signal
 from subprocess import run
 from tempfile import NamedTemporaryFile
+import threading
 from typing import Annotated, Optional
 
 from fastapi import Depends, FastAPI, HTTPException, Request, Response, status
-from fastapi.responses import RedirectResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from jinja2 import Environment, pass_context
 from markdown import markdown
 from passlib.context import CryptContext
 import psycopg2
-from psycopg2.errors import UniqueViolation
-from psycopg2.extensions import connection
+from psycopg2.extensions import connection, ISOLATION_LEVEL_AUTOCOMMIT
 import ruamel.yaml
 import uvicorn
 
 from sql import (
-    db_find_account, db_update_account, db_update_publickey, db_filter_publickeys, db_get_reports,
-    db_get_keys, db_insert_report, db_get_recent_results2, db_patch_approval2, db_get_report,
-    db_ensure_schema, db_get_apikeys, db_update_apikey, db_filter_apikeys, db_clear_delegates,
+    db_find_account, db_update_account, db_update_publickey, db_remove_publickeys, db_get_reports,
+    db_get_keys, db_insert_report, db_get_recent_results2, db_patch_approvals2, db_get_report,
+    db_ensure_schema, db_get_apikeys, db_update_apikey, db_remove_apikeys, db_remove_delegates,
     db_find_subjects, db_insert_result2, db_get_relevant_results2, db_add_delegate, db_get_group,
-    db_filter_accounts, db_get_groups,
+    db_remove_accounts, db_get_groups, db_get_account_state, db_get_results_history2, db_update_rollup2,
+    db_get_rollup2, db_get_rollup_heads2, db_patch_approval_filtered2, db_notify, db_get_generation, db_bump_generation,
+    db_export_results2, db_insert_job, db_claim_job, db_finish_job, db_get_job,
 )
 
 
 logger = logging.getLogger(__name__)
 
+try:
+    import brotli
+except ImportError:
+    brotli = None  # optional: without it, cached views are only offered with gzip (see `cached_view`)
 
 try:
-    from scs_cert_lib import load_spec, annotate_validity, add_period, eval_buckets, evaluate
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None  # optional: without it, the endpoint `/export` is not available
+
+
+try:
+    from scs_cert_lib import load_spec, annotate_validity, lookup_validity, add_period, eval_buckets, evaluate
 except ImportError:
     # the following course of action is not unproblematic because the Tests directory will be
     # mounted to the Docker instance, hence it's hard to tell what version we are gonna get;
     # however, unlike the reloading of the config, the import only happens once, and at that point
     # in time, both monitor.py and scs_cert_lib.py should come from the same git checkout
     import sys; sys.path.insert(0, os.path.abspath('../Tests'))  # noqa: E702
-    from scs_cert_lib import load_spec, annotate_validity, add_period, eval_buckets, evaluate
+    from scs_cert_lib import load_spec, annotate_validity, lookup_validity, add_period, eval_buckets, evaluate
 
 
 class Settings:
@@ -74,6 +103,16 @@ class Settings:
                 self.db_password = fileobj.read().strip()
         else:
             self.db_password = os.getenv("SCM_DB_PASSWORD", "mysecretpassword")
+        # optional read replica (hot standby) to serve read-only endpoints; see `get_read_conn`
+        self.db_replica_host = os.getenv("SCM_DB_REPLICA_HOST", None)
+        self.db_replica_port = os.getenv("SCM_DB_REPLICA_PORT", self.db_port)
+        self.db_replica_user = os.getenv("SCM_DB_REPLICA_USER", self.db_user)
+        replica_password_file_path = os.getenv("SCM_DB_REPLICA_PASSWORD_FILE", None)
+        if replica_password_file_path:
+            with open(os.path.abspath(replica_password_file_path), "r") as fileobj:
+                self.db_replica_password = fileobj.read().strip()
+        else:
+            self.db_replica_password = os.getenv("SCM_DB_REPLICA_PASSWORD", self.db_password)
         self.base_url = os.getenv("SCM_BASE_URL", '/')
         self.bootstrap_path = os.path.abspath("./bootstrap.yaml")
         self.template_path = os.path.abspath("./templates")
@@ -84,6 +123,37 @@ GROUP_PREFIX = 'group-'
 ROLES = {'read_any': 1, 'append_any': 2, 'admin': 4, 'approve': 8}
 # number of days that expired results will be considered in lieu of more recent, but unapproved ones
 GRACE_PERIOD_DAYS = 7
+# Postgres channel for notifications about new verdicts (see `EventBus`)
+EVENT_CHANNEL = 'scm_verdicts'
+# number of seconds after which an idle event stream gets a comment line (so disconnects are detected)
+EVENT_KEEPALIVE_SECONDS = 30
+# cookie that tells which data generation a client has written (see `get_read_conn`)
+WRITTEN_COOKIE = 'scm_written'
+# number of seconds that this cookie is kept by the client (should exceed any plausible replication lag)
+WRITTEN_COOKIE_MAX_AGE = 600
+# maximum number of rendered views to keep in the cache (see `cached_view`)
+VIEW_CACHE_SIZE = 256
+# maximum number of Markdown texts whose conversion to HTML is kept in the cache (see `markdown_to_html`)
+MARKDOWN_CACHE_SIZE = 32
+# minimum size (in bytes) of a response body to be compressed
+COMPRESS_MIN_SIZE = 1000
+# content encodings offered for cached views, in order of preference
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip', )
+# keys needed in each record posted to /results
+APPROVAL_KEYS = ('reportuuid', 'scopeuuid', 'version', 'check', 'approval')
+# upper bound for the number of days that any result can be valid (see `add_period`, lifetime 'year')
+MAX_LIFETIME_DAYS = 430
+# upper bound for the number of data points in a time series (see `get_status_history`)
+MAX_SERIES_LENGTH = 400
+# upper bound for the number of days of the rollup that can be recomputed in one go (see `post_trend_rebuild`)
+MAX_REBUILD_DAYS = 1000
+# number of seconds after which the job worker checks the queue even if it wasn't notified (see `JobWorker`)
+JOB_POLL_SECONDS = 10
+# number of rows that a server-side cursor transfers at a time (see `scan_cursor`)
+SCAN_ITERSIZE = 5000
+# number of rows per chunk of `/export` (record batch for Arrow, row group for Parquet)
+EXPORT_CHUNK_SIZE = 10000
+EXPORT_MEDIA_TYPES = {'parquet': 'application/vnd.apache.parquet', 'arrow': 'application/vnd.apache.arrow.stream'}
 # separator between signature and report data; use something like
 #     ssh-keygen \
 #       -Y sign -f ~/.ssh/id_ed25519 -n report myreport.yaml
@@ -129,8 +199,17 @@ VIEW_SCOPE = {
 REQUIRED_TEMPLATES = tuple(set(fn for view in (VIEW_REPORT, VIEW_DETAIL, VIEW_TABLE, VIEW_SCOPE) for fn in view.values()))
 
 
+@asynccontextmanager
+async def lifespan(app):
+    task = asyncio.create_task(job_worker.run())
+    yield
+    task.cancel()
+
+
 # do I hate these globals, but I don't see another way with these frameworks
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+# compress any response unless it's already compressed (as done by `cached_view`)
+app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_SIZE)
 security = HTTPBasic(realm="Compliance monitor", auto_error=True)  # use False for optional login
 optional_security = HTTPBasic(realm="Compliance monitor", auto_error=False)
 settings = Settings()
@@ -144,6 +223,17 @@ templates_map = {
     k: None for k in REQUIRED_TEMPLATES
 }
 _scopes = {}  # map scope uuid to scope spec dict from YAML file
+# map file path to pair (digest, parsed content) so that a reload only needs to process changed files
+_spec_cache = {}
+_template_cache = {}
+_bootstrap_cache = {}
+_static_generation = 0  # increased whenever the static config is reloaded, see `get_generation`
+# map include_drafts to pair (generation, evaluation), see `get_evaluation`
+_evaluation_cache = {}
+_view_cache = OrderedDict()  # map key to triple (content, media type, encoded variants), see `cached_view`
+_validity_date = None  # date for which the versions in _scopes have been annotated with their validity
+# guards annotating the validity (see `get_scopes`); reentrant because SIGHUP may interrupt the main thread
+_scopes_lock = threading.RLock()
 
 
 class TimestampEncoder(json.JSONEncoder):
@@ -154,7 +244,10 @@ class TimestampEncoder(json.JSONEncoder):
         return super().default(obj)
 
 
-def mk_conn(settings=settings):
+def mk_conn(settings=settings, replica=False):
+    if replica:
+        return psycopg2.connect(host=settings.db_replica_host, user=settings.db_replica_user,
+                                password=settings.db_replica_password, port=settings.db_replica_port)
     return psycopg2.connect(host=settings.db_host, user=settings.db_user,
                             password=settings.db_password, port=settings.db_port)
 
@@ -167,6 +260,197 @@ def get_conn(settings=settings):
         conn.close()
 
 
+def _mk_read_conn(request, settings):
+    if not settings.db_replica_host:
+        return mk_conn(settings=settings)
+    try:
+        conn = mk_conn(settings=settings, replica=True)
+    except psycopg2.OperationalError as e:
+        logger.warning(f"replica unavailable, using primary: {e!r}")
+        return mk_conn(settings=settings)
+    # read-your-writes: if the client has written data that the replica doesn't have yet, use the primary
+    try:
+        written = int(request.cookies.get(WRITTEN_COOKIE, 0))
+    except ValueError:
+        written = 0
+    if written:
+        with conn.cursor() as cur:
+            replicated = db_get_generation(cur)
+        conn.rollback()
+        if replicated < written:
+            conn.close()
+            return mk_conn(settings=settings)
+    return conn
+
+
+def get_read_conn(request: Request, settings=settings):
+    """like `get_conn`, but use the read replica if configured (only use for read-only endpoints!)
+
+    Clients that have recently posted data carry the resulting data generation in a cookie (see
+    `set_written_cookie`); they are served from the primary until the replica has caught up.
+    """
+    conn = _mk_read_conn(request, settings)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def scan_cursor(conn, name):
+    """return named (server-side) cursor for large scans, which transfers rows in chunks of `SCAN_ITERSIZE`
+
+    Mind that a named cursor can only execute one query.
+    """
+    cur = conn.cursor(name=name)
+    cur.itersize = SCAN_ITERSIZE
+    return cur
+
+
+def set_written_cookie(response, generation):
+    """tell the client which data generation it has written, so it can read its own writes"""
+    response.set_cookie(WRITTEN_COOKIE, str(generation), max_age=WRITTEN_COOKIE_MAX_AGE, httponly=True)
+
+
+class EventBus:
+    """Distribute notifications from the Postgres channel `channel` to any number of subscribers.
+
+    Because notifications are sent via the database, this works across multiple worker processes.
+    The listening connection is only kept open while there are subscribers.
+    """
+    def __init__(self, channel, maxsize=100):
+        self.channel = channel
+        self.maxsize = maxsize
+        self.conn = None
+        self.queues = set()
+
+    def _listen(self):
+        conn = mk_conn(settings=settings)
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f'LISTEN {self.channel};')
+        asyncio.get_running_loop().add_reader(conn.fileno(), self._on_readable)
+        self.conn = conn
+
+    def _unlisten(self):
+        if self.conn is None:
+            return
+        asyncio.get_running_loop().remove_reader(self.conn.fileno())
+        self.conn.close()
+        self.conn = None
+
+    def _on_readable(self):
+        try:
+            self.conn.poll()
+        except psycopg2.Error:
+            logger.exception("lost connection for notifications; will reconnect with next subscriber")
+            self._unlisten()
+            return
+        while self.conn.notifies:
+            payload = self.conn.notifies.pop(0).payload
+            for queue in self.queues:
+                try:
+                    queue.put_nowait(payload)
+                except asyncio.QueueFull:
+                    pass  # slow subscriber: drop event rather than letting the queue grow indefinitely
+
+    def subscribe(self):
+        if self.conn is None:
+            self._listen()
+        queue = asyncio.Queue(maxsize=self.maxsize)
+        self.queues.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.queues.discard(queue)
+        if not self.queues:
+            self._unlisten()
+
+
+event_bus = EventBus(EVENT_CHANNEL)
+
+
+class JobWorker:
+    """Process the ingestion jobs queued by `post_report`, one at a time, in a separate thread.
+
+    The queue is kept in the database (table job), and jobs are claimed via SKIP LOCKED, so any number of
+    worker processes can share it. Each job is processed within the transaction that claims it, so it
+    stays queued if the processing is interrupted.
+    """
+    def __init__(self, poll_seconds):
+        self.poll_seconds = poll_seconds
+        self.wakeup = asyncio.Event()
+        self.conn = None
+        self.rollup_day = None  # day up to which the rollup has been filled (see `_fill_rollup`)
+
+    def notify(self):
+        """make the worker check the queue right away (call after queuing a job)"""
+        self.wakeup.set()
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                processed = await asyncio.to_thread(self._process_next)
+                if not processed:
+                    await asyncio.to_thread(self._fill_rollup)
+            except Exception as e:
+                logger.error(f"job worker failed: {e!r}")
+                if self.conn is not None:
+                    self.conn.close()
+                    self.conn = None
+                processed = False
+            if processed:
+                continue
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def _get_conn(self):
+        if self.conn is None:
+            self.conn = mk_conn(settings=settings)
+        return self.conn
+
+    def _fill_rollup(self):
+        """fill the daily rollup up to today (see `fill_rollup`), unless already done today"""
+        today = date.today()
+        if self.rollup_day == today:
+            return
+        conn = self._get_conn()
+        fill_rollup(conn, today)
+        conn.commit()
+        self.rollup_day = today
+
+    def _process_next(self):
+        """process the oldest queued job, if any; return whether there was one"""
+        conn = self._get_conn()
+        with conn.cursor() as cur:
+            job = db_claim_job(cur)
+            if job is None:
+                conn.rollback()
+                return False
+            jobid, subject, roles, content_type, payload = job
+            # use savepoint so that a partial ingestion can be rolled back while the job remains locked
+            cur.execute('SAVEPOINT ingest;')
+            try:
+                statuses, generation = ingest_reports(cur, (subject, roles), content_type, payload)
+            except Exception as e:
+                cur.execute('ROLLBACK TO SAVEPOINT ingest;')
+                if isinstance(e, HTTPException):
+                    detail = e.detail
+                else:
+                    logger.exception(f"job {jobid} failed")
+                    detail = f"invalid report: {e!r}"
+                db_finish_job(cur, jobid, 'failed', {'detail': detail})
+            else:
+                db_finish_job(cur, jobid, 'done', statuses, generation)
+        conn.commit()
+        return True
+
+
+job_worker = JobWorker(JOB_POLL_SECONDS)
+
+
 def ssh_validate(keys, signature, data):
     # based on https://www.agwa.name/blog/post/ssh_signatures
     with NamedTemporaryFile(mode="w") as allowed_signers_file, \
@@ -219,35 +503,73 @@ def get_current_account(
         )
 
 
-def import_bootstrap(bootstrap_path, conn):
-    ryaml = ruamel.yaml.YAML(typ='safe')
-    with open(bootstrap_path) as fp:
-        data = ryaml.load(fp)
+def _read_with_digest(path):
+    """return contents of the file at `path` together with a digest that can be used to detect changes"""
+    with open(path, "r") as fileobj:
+        text = fileobj.read()
+    return text, hashlib.sha256(text.encode()).hexdigest()
+
+
+def import_bootstrap(bootstrap_path, conn, cache=None):
+    text, digest = _read_with_digest(bootstrap_path)
+    # the cache only saves parsing the file: the database may have changed in the meantime,
+    # so the delta must be computed in any case (this is cheap)
+    digest_data = None if cache is None else cache.get(bootstrap_path)
+    if digest_data is not None and digest_data[0] == digest:
+        data = digest_data[1]
+    else:
+        logger.debug(f"parsing {bootstrap_path}")
+        ryaml = ruamel.yaml.YAML(typ='safe')
+        data = ryaml.load(text)
+        if cache is not None:
+            cache[bootstrap_path] = digest, data
     if not data or not isinstance(data, dict):
         return
     accounts = data.get('accounts', ())
     subjects = data.get('subjects', {})
     if not accounts and not subjects:
         return
+    accounts = {account['subject']: account for account in accounts}
     with conn.cursor() as cur:
-        accountids = []
-        for account in accounts:
+        # compare against the state of the database and only apply the delta (all in one transaction)
+        state = db_get_account_state(cur)
+        removed = [subject for subject in state if subject not in accounts]
+        if removed:
+            db_remove_accounts(cur, removed)
+        # first pass: make sure all accounts exist, so delegates can be resolved in the second pass
+        accountids = {}
+        for subject, account in accounts.items():
             roles = sum(ROLES[r] for r in account.get('roles', ()))
-            acc_record = {'subject': account['subject'], 'roles': roles, 'group': account.get('group')}
-            accountid = db_update_account(cur, acc_record)
-            accountids.append(accountid)
-            db_clear_delegates(cur, accountid)
-            for delegate in account.get('delegates', ()):
+            group = account.get('group')
+            current = state.get(subject)
+            if current is not None and (current['roles'], current['group']) == (roles, group):
+                accountids[subject] = current['accountid']
+                continue
+            acc_record = {'subject': subject, 'roles': roles, 'group': group}
+            accountids[subject] = db_update_account(cur, acc_record)
+        for subject, account in accounts.items():
+            accountid = accountids[subject]
+            current = state.get(subject) or {'delegates': set(), 'api_keys': set(), 'keys': {}}
+            delegates = set(account.get('delegates', ()))
+            for delegate in delegates - current['delegates']:
                 db_add_delegate(cur, accountid, delegate)
-            keyids = set(db_update_apikey(cur, accountid, h) for h in account.get("api_keys", ()))
-            db_filter_apikeys(cur, accountid, lambda keyid, *_: keyid in keyids)
-            keyids = set(db_update_publickey(cur, accountid, key) for key in account.get("keys", ()))
-            db_filter_publickeys(cur, accountid, lambda keyid, *_: keyid in keyids)
-        db_filter_accounts(cur, lambda accountid, *_: accountid in accountids)
+            if current['delegates'] - delegates:
+                db_remove_delegates(cur, accountid, current['delegates'] - delegates)
+            api_keys = set(account.get('api_keys', ()))
+            for apikey_hash in api_keys - current['api_keys']:
+                db_update_apikey(cur, accountid, apikey_hash)
+            if current['api_keys'] - api_keys:
+                db_remove_apikeys(cur, accountid, current['api_keys'] - api_keys)
+            keys = {key['public_key_name']: key for key in account.get('keys', ())}
+            for keyname, key in keys.items():
+                if current['keys'].get(keyname) != (key['public_key'], key['public_key_type']):
+                    db_update_publickey(cur, accountid, key)
+            if current['keys'].keys() - keys.keys():
+                db_remove_publickeys(cur, accountid, current['keys'].keys() - keys.keys())
         conn.commit()
 
 
-def _evaluate_version(version, scope_results):
+def _evaluate_version(version, scope_results, validity):
     """evaluate the results for `version` and return the canonical JSON output"""
     target_results = {
         tname: {
@@ -261,18 +583,22 @@ def _evaluate_version(version, scope_results):
         'result': target_results['main']['result'],
         'targets': target_results,
         'tc_target': version['tc_target'],
-        'validity': version['validity'],
+        'validity': validity,
     }
 
 
-def _evaluate_scope(spec, scope_results, include_drafts=False):
-    """evaluate the results for `scope` and return the canonical JSON output"""
+def _evaluate_scope(spec, scope_results, include_drafts=False, checkdate=None):
+    """evaluate the results for `scope` and return the canonical JSON output
+
+    The validity of the versions is taken as of `checkdate` (default: today).
+    """
     testcases = spec['testcases']
     versions = spec['versions']
+    validity_lookup = lookup_validity(spec['_timeline'], checkdate or date.today())
     version_results = {
-        vname: _evaluate_version(version, scope_results)
+        vname: _evaluate_version(version, scope_results, validity_lookup[vname])
         for vname, version in versions.items()
-        if version['_explicit_validity']
+        if validity_lookup.get(vname)
     }
     winner = None  # first passed version that's not a draft
     result = -1
@@ -334,35 +660,66 @@ def _update_lookup(spec, target_dict):
         target_dict[(scope_uuid, tc_id)] = testcase
 
 
-def import_cert_yaml(yaml_path, target_dict):
-    yaml = ruamel.yaml.YAML(typ='safe')
-    with open(yaml_path, "r") as fileobj:
-        spec = load_spec(yaml.load(fileobj.read()))
-    annotate_validity(spec['timeline'], spec['versions'], date.today())
+def import_cert_yaml(yaml_path, target_dict, cache=None):
+    text, digest = _read_with_digest(yaml_path)
+    digest_spec = None if cache is None else cache.get(yaml_path)
+    if digest_spec is not None and digest_spec[0] == digest:
+        spec = digest_spec[1]
+    else:
+        logger.debug(f"parsing {yaml_path}")
+        yaml = ruamel.yaml.YAML(typ='safe')
+        spec = load_spec(yaml.load(text))
+        if cache is not None:
+            cache[yaml_path] = digest, spec
+    annotate_validity(spec['_timeline'], spec['versions'], date.today())
     target_dict[spec['uuid']] = spec
     _update_lookup(spec, target_dict)
 
 
-def import_cert_yaml_dir(yaml_path, target_dict):
-    for fn in sorted(os.listdir(yaml_path)):
-        if fn.startswith('scs-') and fn.endswith('.yaml'):
-            import_cert_yaml(os.path.join(yaml_path, fn), target_dict)
+def import_cert_yaml_dir(yaml_path, target_dict, cache=None):
+    paths = [
+        os.path.join(yaml_path, fn)
+        for fn in sorted(os.listdir(yaml_path))
+        if fn.startswith('scs-') and fn.endswith('.yaml')
+    ]
+    for path in paths:
+        import_cert_yaml(path, target_dict, cache=cache)
+    if cache is not None:
+        # forget about files that have been removed
+        for path in set(cache) - set(paths):
+            del cache[path]
 
 
 def get_scopes():
-    """returns the scopes dict"""
-    return _scopes
-
-
-def import_templates(template_dir, env, templates):
+    """returns the scopes dict, with validity of versions annotated as of today"""
+    global _validity_date
+    today = date.today()
+    with _scopes_lock:
+        scopes = _scopes
+        if _validity_date != today:
+            # the day has rolled over since the last annotation, so this has to be updated
+            # (this is cheap because the timeline has been precomputed at load time)
+            for key, spec in scopes.items():
+                if isinstance(key, str):  # skip the entries of the testcase lookup, see _update_lookup
+                    annotate_validity(spec['_timeline'], spec['versions'], today)
+            _validity_date = today
+    return scopes
+
+
+def import_templates(template_dir, env, templates, cache=None):
     for fn in os.listdir(template_dir):
         if fn.startswith("."):
             continue
         name = fn.removesuffix('.j2')
         if name not in templates:
             continue
-        with open(os.path.join(template_dir, fn), "r") as fileobj:
-            templates[name] = env.from_string(fileobj.read())
+        path = os.path.join(template_dir, fn)
+        text, digest = _read_with_digest(path)
+        if cache is not None and templates[name] is not None and cache.get(path) == digest:
+            continue
+        templates[name] = env.from_string(text)
+        if cache is not None:
+            cache[path] = digest
 
 
 def validate_templates(templates, required_templates=REQUIRED_TEMPLATES):
@@ -400,7 +757,7 @@ async def root():
 @app.get("/reports")
 async def get_reports(
     account: Annotated[tuple[str, str], Depends(auth)],
-    conn: Annotated[connection, Depends(get_conn)],
+    conn: Annotated[connection, Depends(get_read_conn)],
     subject: Optional[str] = None, limit: int = 10, skip: int = 0,
 ):
     if subject is None:
@@ -414,7 +771,7 @@ async def get_reports(
 @app.get("/reports/{report_uuid}")
 async def get_report(
     account: Annotated[tuple[str, str], Depends(auth)],
-    conn: Annotated[connection, Depends(get_conn)],
+    conn: Annotated[connection, Depends(get_read_conn)],
     report_uuid: str,
 ):
     with conn.cursor() as cur:
@@ -426,24 +783,24 @@ async def get_report(
     return Response(content=json.dumps(spec, indent=2), media_type="application/json")
 
 
-@app.post("/reports")
+@app.post("/reports", status_code=202)
 async def post_report(
     request: Request,
     account: Annotated[tuple[str, str], Depends(auth)],
     conn: Annotated[connection, Depends(get_conn)],
+    response: Response,
 ):
-    # TODO this endpoint handles almost all user input, so check thoroughly and generate nice errors!
-    # check_role call further below because we need the subject from the document
+    """verify signature and queue the reports for ingestion (see `ingest_reports`), returning the job id"""
+    # check_role call happens upon ingestion because we need the subject from the document
     # (we could expect the subject in the path or query and then later only check equality)
     content_type = request.headers['content-type']
     if content_type not in ('application/x-signed-yaml', 'application/x-signed-json'):
         # see https://developer.mozilla.org/en-US/docs/Web/HTTP/Status/415
         raise HTTPException(status_code=415, detail="Unsupported Media Type")
 
-    auth_subject, _ = account
+    auth_subject, roles = account
     with conn.cursor() as cur:
         keys = db_get_keys(cur, auth_subject)
-        delegation_subjects = db_find_subjects(cur, auth_subject)
 
     body = await request.body()
     body_text = body.decode("utf-8")
@@ -458,7 +815,22 @@ async def post_report(
     except Exception:
         raise HTTPException(status_code=401, detail="verification failed")
 
-    json_texts = []
+    with conn.cursor() as cur:
+        jobid = db_insert_job(cur, auth_subject, roles, content_type, body_text)
+    conn.commit()
+    job_worker.notify()
+    job_url = f"{settings.base_url}jobs/{jobid}"
+    response.headers['Location'] = job_url
+    return {'job': jobid, 'url': job_url}
+
+
+def ingest_reports(cur, account, content_type, body_text):
+    """parse reports from `body_text` and insert them, returning pair (statuses, generation)
+
+    Here, `statuses` lists the status for each document, and `generation` is the resulting data
+    generation (or None if nothing was inserted). Raises HTTPException if the documents are not acceptable.
+    """
+    # TODO this function handles almost all user input, so check thoroughly and generate nice errors!
     if content_type.endswith('-yaml'):
         yaml = ruamel.yaml.YAML(typ='safe')
         documents = list(yaml.load_all(body_text))  # ruamel.yaml doesn't have API docs: this is a generator
@@ -467,50 +839,90 @@ async def post_report(
         documents = [json.loads(body_text)]
         json_texts = [body_text]
     else:
-        # unreachable due to the content-type check at the top
+        # unreachable due to the content-type check in `post_report`
         raise AssertionError("branch should never be reached")
 
-    if not documents:
-        raise HTTPException(status_code=200, detail="empty reports")
-
-    allowed_subjects = {auth_subject} | set(delegation_subjects)
+    auth_subject, _ = account
+    allowed_subjects = {auth_subject} | set(db_find_subjects(cur, auth_subject))
     for document in documents:
         check_role(account, document['subject'], ROLES['append_any'])
         if document['subject'] not in allowed_subjects:
             raise HTTPException(status_code=401, detail="delegation problem?")
 
+    # handle each document idempotently, so an upload can be retried safely: skip reports already present
+    statuses = []
+    rollup_keys = {}  # map (subject, scopeuuid, day) to report uuid
+    for document, json_text in zip(documents, json_texts):
+        rundata = document['run']
+        uuid, subject, checked_at = rundata['uuid'], document['subject'], document['checked_at']
+        scopeuuid = document['spec']['uuid']
+        reportid = db_insert_report(cur, uuid, checked_at, subject, json_text)
+        if reportid is None:
+            statuses.append({'uuid': uuid, 'status': 'present'})
+            continue
+        statuses.append({'uuid': uuid, 'status': 'ok'})
+        if 'versions' not in document:
+            # If this key is missing, this means we have a newer-style report that doesn't redundantly list
+            # results per version. One reason for this change is that the meaning of a testcase identifier
+            # no longer depends on the scope version, and we can quite simply read off the results from the
+            # invocations. -- Use the dummy version '*' as long as the db schema still expects a version.
+            # Invocations carried over from a previous report (see option --incremental of the checker)
+            # have their own `checked_at`, which must be kept so these results expire as before.
+            document['versions'] = {'*': {
+                tc_id: {'result': result, 'invocation': inv_id, 'checked_at': invocation.get('checked_at')}
+                for inv_id, invocation in document['run']['invocations'].items()
+                for tc_id, result in invocation['results'].items()
+            }}
+        for version, vdata in document['versions'].items():
+            for check, rdata in vdata.items():
+                result = rdata['result']
+                approval = 1 == result  # pre-approve good result
+                db_insert_result2(
+                    cur, rdata.get('checked_at') or checked_at, subject, scopeuuid, version, check, result,
+                    approval, reportid,
+                )
+        rollup_keys[(subject, scopeuuid, _as_date(checked_at))] = uuid
+    for (subject, scopeuuid, day), report_uuid in rollup_keys.items():
+        _update_rollup(cur, subject, scopeuuid, day, report_uuid=report_uuid)
+    generation = db_bump_generation(cur) if rollup_keys else None
+    return statuses, generation
+
+
+@app.get("/jobs/{jobid}")
+async def get_job(
+    account: Annotated[tuple[str, str], Depends(auth)],
+    conn: Annotated[connection, Depends(get_conn)],
+    response: Response,
+    jobid: int,
+):
+    """report status of ingestion job (see `post_report`); when done, list the status of each report"""
     with conn.cursor() as cur:
-        for document, json_text in zip(documents, json_texts):
-            rundata = document['run']
-            uuid, subject, checked_at = rundata['uuid'], document['subject'], document['checked_at']
-            scopeuuid = document['spec']['uuid']
-            try:
-                reportid = db_insert_report(cur, uuid, checked_at, subject, json_text)
-            except UniqueViolation:
-                raise HTTPException(status_code=409, detail="Conflict: report already present")
-            if 'versions' not in document:
-                # If this key is missing, this means we have a newer-style report that doesn't redundantly list
-                # results per version. One reason for this change is that the meaning of a testcase identifier
-                # no longer depends on the scope version, and we can quite simply read off the results from the
-                # invocations. -- Use the dummy version '*' as long as the db schema still expects a version.
-                document['versions'] = {'*': {
-                    tc_id: {'result': result, 'invocation': inv_id}
-                    for inv_id, invocation in document['run']['invocations'].items()
-                    for tc_id, result in invocation['results'].items()
-                }}
-            for version, vdata in document['versions'].items():
-                for check, rdata in vdata.items():
-                    result = rdata['result']
-                    approval = 1 == result  # pre-approve good result
-                    db_insert_result2(cur, checked_at, subject, scopeuuid, version, check, result, approval, reportid)
-    conn.commit()
+        job = db_get_job(cur, jobid)
+    if job is None:
+        raise HTTPException(status_code=404)
+    check_role(account, job['subject'], ROLES['admin'])
+    generation = job.pop('generation')
+    if generation is not None:
+        # the client may now want to read the data it has written
+        set_written_cookie(response, generation)
+    return job
+
+
+def _day_end(checkdate):
+    """return the `datetime` when the day `checkdate` ends"""
+    return datetime.combine(checkdate, datetime.min.time()) + timedelta(days=1)
 
 
 def convert_result_rows_to_dict2(
     rows, scopes_lookup, grace_period_days=0, scopes=(), subjects=(), include_report=False, include_drafts=False,
+    checkdate=None,
 ):
-    """evaluate all versions occurring in query result `rows`, returning canonical JSON representation"""
-    now = datetime.now()
+    """evaluate all versions occurring in query result `rows`, returning canonical JSON representation
+
+    If `checkdate` is given, evaluate as of the last instant of that day (default: now), so a result that
+    expires at midnight still counts for the day before.
+    """
+    now = datetime.now() if checkdate is None else _day_end(checkdate) - timedelta(microseconds=1)
     if grace_period_days:
         now -= timedelta(days=grace_period_days)
     # collect result per subject/scope/version
@@ -544,26 +956,387 @@ def convert_result_rows_to_dict2(
             _ = preliminary[subject][scope]
     return {
         subject: {
-            scope_uuid: _evaluate_scope(scopes_lookup[scope_uuid], scope_result, include_drafts=include_drafts)
+            scope_uuid: _evaluate_scope(
+                scopes_lookup[scope_uuid], scope_result, include_drafts=include_drafts, checkdate=checkdate,
+            )
             for scope_uuid, scope_result in subject_result.items()
         }
         for subject, subject_result in preliminary.items()
     }
 
 
-@app.get("/status")
-async def get_status(
-    request: Request,
-    conn: Annotated[connection, Depends(get_conn)],
-    subject: str = None, scopeuuid: str = None,
-):
+def _sweep_result_rows2(rows, scopes_lookup, subjects, scopeuuid, dates, include_drafts=False):
+    """evaluate `rows` (ordered by checked_at) as of each date in `dates` (ascending), yielding pairs (date, results)
+
+    Instead of querying the state for each date anew, sweep through the rows once, keeping track of the
+    most recent row for each subject/scope/version/testcase.
+    """
+    latest = {}
+    rows = iter(rows)
+    row = next(rows, None)
+    for checkdate in dates:
+        until = _day_end(checkdate)
+        while row is not None and row[5] < until:
+            latest[row[:4]] = row
+            row = next(rows, None)
+        yield checkdate, convert_result_rows_to_dict2(
+            latest.values(), scopes_lookup, subjects=subjects, scopes=(scopeuuid, ),
+            include_drafts=include_drafts, checkdate=checkdate,
+        )
+
+
+def convert_result_rows_to_series2(rows, scopes_lookup, subjects, scopeuuid, dates, include_drafts=False):
+    """evaluate `rows` (ordered by checked_at) as of each date in `dates` (ascending), returning list of records"""
+    series = []
+    for checkdate, results in _sweep_result_rows2(rows, scopes_lookup, subjects, scopeuuid, dates, include_drafts):
+        for subject in subjects:
+            scope_result = results[subject][scopeuuid]
+            series.append({
+                'date': checkdate,
+                'subject': subject,
+                'scopeuuid': scopeuuid,
+                'result': scope_result['result'],
+                'passed': scope_result['passed'],
+                'validity': scope_result['validity'],
+            })
+    return series
+
+
+def _check_accept_json(request):
     accept = request.headers['accept']
     if 'application/json' not in accept and '*/*' not in accept:
         # see https://developer.mozilla.org/en-US/docs/Web/HTTP/Status/406
         raise HTTPException(status_code=406, detail="client needs to accept application/json")
+
+
+@app.get("/status")
+async def get_status(
+    request: Request,
+    conn: Annotated[connection, Depends(get_read_conn)],
+    subject: str = None, scopeuuid: str = None, as_of: Optional[date] = None,
+):
+    _check_accept_json(request)
+    if subject is None and scopeuuid is None and as_of is None:
+        # most common case: the full current status, which has probably been evaluated (and encoded) before
+        with conn.cursor() as cur:
+            return cached_view(
+                ('status', get_generation(cur)),
+                lambda: JSONResponse(content=jsonable_encoder(get_evaluation(cur)['results'])),
+                request.headers.get('accept-encoding', ''),
+            )
+    until = None if as_of is None else _day_end(as_of)
+    with scan_cursor(conn, 'status') as cur:
+        rows2 = db_get_relevant_results2(cur, subject, scopeuuid, approved_only=False, until=until)
+        return convert_result_rows_to_dict2(rows2, get_scopes(), include_report=True, checkdate=as_of)
+
+
+@app.get("/status/history")
+async def get_status_history(
+    request: Request,
+    conn: Annotated[connection, Depends(get_read_conn)],
+    subject: str, scopeuuid: str, start: date, end: Optional[date] = None, step: int = 1,
+):
+    _check_accept_json(request)
+    if end is None:
+        end = date.today()
+    if step < 1 or end < start:
+        raise HTTPException(status_code=400, detail="need step >= 1 and start <= end")
+    if (end - start).days // step >= MAX_SERIES_LENGTH:
+        raise HTTPException(status_code=400, detail=f"too many data points (max. {MAX_SERIES_LENGTH})")
+    dates = [start + timedelta(days=n) for n in range(0, (end - start).days + 1, step)]
+    scopeuuid = _resolve_scope(scopeuuid)
+    if scopeuuid not in get_scopes():
+        raise HTTPException(status_code=404, detail="scope not found")
+    since = datetime.combine(start, datetime.min.time()) - timedelta(days=MAX_LIFETIME_DAYS)
+    with conn.cursor() as cur:
+        _, subjects = _resolve_group(cur, subject)
+        rows2 = []
+        for subj in subjects:
+            rows2.extend(db_get_results_history2(cur, subj, scopeuuid, since, _day_end(end)))
+    rows2.sort(key=lambda row: row[5])
+    return convert_result_rows_to_series2(rows2, get_scopes(), subjects, scopeuuid, dates)
+
+
+@app.get("/events")
+async def get_events(request: Request):
+    """stream new verdicts as server-sent events (one per subject and scope whenever results change)"""
+    queue = event_bus.subscribe()
+
+    async def generate():
+        try:
+            yield ': connected\n\n'
+            while not await request.is_disconnected():
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f'event: verdict\ndata: {payload}\n\n'
+        finally:
+            event_bus.unsubscribe(queue)
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+def _as_date(checked_at):
+    """turn value of field `checked_at` of a report into a `date` (it's a str if the report was given as JSON)"""
+    if isinstance(checked_at, str):
+        checked_at = datetime.fromisoformat(checked_at)
+    if isinstance(checked_at, datetime):
+        return checked_at.date()
+    return checked_at
+
+
+def _rollup_scope_result(scope_result):
+    """extract mapping from version name to result from `scope_result` (see `_evaluate_scope`)"""
+    # the empty string denotes the overall result (see table rollup2)
+    return {'': scope_result['result'], **{
+        vname: version_result['result']
+        for vname, version_result in scope_result['versions'].items()
+    }}
+
+
+def _update_rollup(cur, subject, scopeuuid, day, report_uuid=None):
+    """update the daily rollup for `subject` and `scopeuuid` as of `day` and notify listeners (see `get_events`)"""
+    scopes = get_scopes()
+    if scopeuuid not in scopes:
+        return
+    heads = db_get_rollup_heads2(cur, subject, scopeuuid)
+    # fill in the days between the latest row and `day` first, so there is no gap (see `fill_rollup`)
+    for _, _, latest in heads:
+        if latest < day - timedelta(days=1):
+            rebuild_rollup(cur.connection, subject, scopeuuid, latest + timedelta(days=1), day - timedelta(days=1))
+    # the approval of results doesn't matter here, so approving results needn't update the rollup
+    rows2 = db_get_relevant_results2(cur, subject, scopeuuid, approved_only=False, until=_day_end(day))
+    results2 = convert_result_rows_to_dict2(
+        rows2, scopes, subjects=(subject, ), scopes=(scopeuuid, ), checkdate=day,
+    )
+    scope_result = results2[subject][scopeuuid]
+    db_update_rollup2(cur, subject, scopeuuid, {day: _rollup_scope_result(scope_result)})
+    # the rollup may already extend beyond `day` (see `fill_rollup`, or a report that was checked before
+    # midnight but arrived afterwards), so the results of this report must be carried over to those days
+    for _, _, latest in heads:
+        if latest > day:
+            rebuild_rollup(cur.connection, subject, scopeuuid, day + timedelta(days=1), latest)
+    _notify_verdict(cur, subject, scopeuuid, day, scope_result, report_uuid=report_uuid)
+
+
+def _notify_verdict(cur, subject, scopeuuid, day, scope_result, report_uuid=None):
+    """notify listeners (see `get_events`) of the verdict `scope_result` for `subject` and `scopeuuid` as of `day`"""
+    db_notify(cur, EVENT_CHANNEL, json.dumps({
+        'subject': subject,
+        'scopeuuid': scopeuuid,
+        'date': day,
+        'result': scope_result['result'],
+        'summary': summary_filter(scope_result),
+        'report': report_uuid,
+    }, cls=TimestampEncoder))
+
+
+def rebuild_rollup(conn, subject, scopeuuid, start, end):
+    """recompute the daily rollup for `subject` and `scopeuuid` from scratch for the days from `start` to `end`
+
+    Returns the evaluation (see `_evaluate_scope`) as of `end`.
+    """
+    dates = [start + timedelta(days=n) for n in range((end - start).days + 1)]
+    since = datetime.combine(start, datetime.min.time()) - timedelta(days=MAX_LIFETIME_DAYS)
+    day_results = {}
+    with scan_cursor(conn, 'history') as scan:
+        rows2 = db_get_results_history2(scan, subject, scopeuuid, since, _day_end(end))
+        for day, results2 in _sweep_result_rows2(rows2, get_scopes(), (subject, ), scopeuuid, dates):
+            scope_result = results2[subject][scopeuuid]
+            day_results[day] = _rollup_scope_result(scope_result)
     with conn.cursor() as cur:
-        rows2 = db_get_relevant_results2(cur, subject, scopeuuid, approved_only=False)
-    return convert_result_rows_to_dict2(rows2, get_scopes(), include_report=True)
+        db_update_rollup2(cur, subject, scopeuuid, day_results)
+    return scope_result
+
+
+def fill_rollup(conn, end):
+    """extend the daily rollup of each subject and scope from its latest day up to `end` and notify listeners
+
+    Rows are otherwise only added for days with a report, so the expiry of results would go unnoticed.
+    """
+    with conn.cursor() as cur:
+        heads = db_get_rollup_heads2(cur)
+    scopes = get_scopes()
+    for subject, scopeuuid, latest in heads:
+        if latest < end and scopeuuid in scopes:
+            scope_result = rebuild_rollup(conn, subject, scopeuuid, latest + timedelta(days=1), end)
+            with conn.cursor() as cur:
+                _notify_verdict(cur, subject, scopeuuid, end, scope_result)
+
+
+def _aggregate_rollup_rows(rows, start, bucket_days):
+    """aggregate daily rollup `rows` (ordered by subject, scope, version, day) into buckets of `bucket_days` days"""
+    trend = []
+    record = None
+    for day, subject, scopeuuid, version, result in rows:
+        bucket = start + timedelta(days=(day - start).days // bucket_days * bucket_days)
+        if record is None or (record['date'], record['subject'], record['scopeuuid'], record['version']) != \
+                (bucket, subject, scopeuuid, version):
+            record = {
+                'date': bucket, 'subject': subject, 'scopeuuid': scopeuuid, 'version': version,
+                'result': result, 'days': 0, 'passed_days': 0,
+            }
+            trend.append(record)
+        # represent the bucket by its worst result (treating missing values as worse than inconclusive)
+        record['result'] = min(record['result'], result, key=lambda r: RESULT_SCORE[r])
+        record['days'] += 1
+        record['passed_days'] += result == 1
+    return trend
+
+
+@app.get("/trend")
+async def get_trend(
+    request: Request,
+    conn: Annotated[connection, Depends(get_read_conn)],
+    start: date, end: Optional[date] = None, subject: str = None, scopeuuid: str = None,
+    granularity: str = 'day', format: str = 'json',
+):
+    if granularity not in ('day', 'week') or format not in ('json', 'csv'):
+        raise HTTPException(status_code=400, detail="granularity must be day or week, format json or csv")
+    if end is None:
+        end = date.today()
+    if end < start:
+        raise HTTPException(status_code=400, detail="need start <= end")
+    bucket_days = 1
+    if granularity == 'week':
+        start -= timedelta(days=start.weekday())  # align buckets with calendar weeks
+        bucket_days = 7
+    # downsample if necessary to keep the size of the response bounded
+    bucket_days = max(bucket_days, math.ceil(((end - start).days + 1) / MAX_SERIES_LENGTH))
+    if scopeuuid is not None:
+        scopeuuid = _resolve_scope(scopeuuid)
+    with conn.cursor() as cur:
+        rows = db_get_rollup2(cur, subject, scopeuuid, start, end + timedelta(days=1))
+    trend = _aggregate_rollup_rows(rows, start, bucket_days)
+    if format == 'json':
+        return trend
+    fileobj = io.StringIO()
+    writer = csv.DictWriter(
+        fileobj, fieldnames=('date', 'subject', 'scopeuuid', 'version', 'result', 'days', 'passed_days'),
+    )
+    writer.writeheader()
+    writer.writerows(trend)
+    return Response(content=fileobj.getvalue(), media_type='text/csv')
+
+
+@app.post("/trend/rebuild")
+async def post_trend_rebuild(
+    request: Request,
+    account: Annotated[tuple[str, str], Depends(auth)],
+    conn: Annotated[connection, Depends(get_conn)],
+    subject: str, scopeuuid: str, start: date, end: Optional[date] = None,
+):
+    """recompute the daily rollup from scratch for the given subject, scope, and range of dates"""
+    check_role(account, roles=ROLES['admin'])
+    if end is None:
+        end = date.today()
+    if end < start or end > date.today():
+        raise HTTPException(status_code=400, detail="need start <= end <= today")
+    if (end - start).days >= MAX_REBUILD_DAYS:
+        raise HTTPException(status_code=400, detail=f"range too large (max. {MAX_REBUILD_DAYS} days)")
+    scopeuuid = _resolve_scope(scopeuuid)
+    if scopeuuid not in get_scopes():
+        raise HTTPException(status_code=404, detail="scope not found")
+    rebuild_rollup(conn, subject, scopeuuid, start, end)
+    conn.commit()
+
+
+class _ExportSink:
+    """file-like object that collects written data until it's drained (used by `_generate_export`)"""
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _export_schema():
+    return pyarrow.schema([
+        ('resultid', pyarrow.int64()),
+        ('checked_at', pyarrow.timestamp('us')),
+        ('subject', pyarrow.string()),
+        ('scopeuuid', pyarrow.string()),
+        ('scope', pyarrow.string()),
+        ('version', pyarrow.string()),
+        ('testcase', pyarrow.string()),
+        ('result', pyarrow.int8()),
+        ('approval', pyarrow.bool_()),
+        ('reportuuid', pyarrow.string()),
+    ])
+
+
+def _generate_export(request, format, **filters):
+    """yield `format`-encoded test results matching `filters`, chunk by chunk
+
+    The database connection is only opened once the response is being streamed (so it can't leak if the
+    client goes away before that), and it's closed in the end.
+    """
+    schema = _export_schema()
+    scope_names = {key: spec['name'] for key, spec in get_scopes().items() if isinstance(key, str)}
+    sink = _ExportSink()
+    conn = _mk_read_conn(request, settings)
+    try:
+        if format == 'parquet':
+            writer = pyarrow.parquet.ParquetWriter(sink, schema)
+        else:
+            writer = pyarrow.ipc.new_stream(sink, schema)
+        with scan_cursor(conn, 'export') as cur:
+            for rows in db_export_results2(cur, chunk_size=EXPORT_CHUNK_SIZE, **filters):
+                columns = list(zip(*rows))
+                # the name of the scope is looked up here rather than taken from the report (see `db_export_results2`)
+                columns.insert(4, [scope_names.get(scopeuuid) for scopeuuid in columns[3]])
+                columns = [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)]
+                writer.write_batch(pyarrow.RecordBatch.from_arrays(columns, schema=schema))
+                yield sink.drain()
+        writer.close()
+        yield sink.drain()
+    finally:
+        conn.close()
+
+
+@app.get("/export")
+async def get_export(
+    request: Request,
+    account: Annotated[tuple[str, str], Depends(auth)],
+    subject: str = None, scopeuuid: str = None, start: Optional[date] = None, end: Optional[date] = None,
+    format: str = 'parquet',
+):
+    """stream test results along with report metadata in a columnar format for offline analysis"""
+    check_role(account, roles=ROLES['admin'])
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be parquet or arrow")
+    if pyarrow is None:
+        raise HTTPException(status_code=501, detail="export needs Python package pyarrow")
+    if scopeuuid is not None:
+        scopeuuid = _resolve_scope(scopeuuid)
+    since = None if start is None else datetime.combine(start, datetime.min.time())
+    until = None if end is None else _day_end(end)
+    # the connection must stay open while streaming, so don't use a dependency here (cf. `get_read_conn`)
+    return StreamingResponse(
+        _generate_export(request, format, subject=subject, scopeuuid=scopeuuid, since=since, until=until),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={'Content-Disposition': f'attachment; filename="results.{format}"'},
+    )
 
 
 def _build_report_url(base_url, report, *args, **kwargs):
@@ -576,7 +1349,7 @@ def _build_report_url(base_url, report, *args, **kwargs):
     return url
 
 
-def render_view(view, view_type, detail_page='detail', base_url='/', title=None, **kwargs):
+def render_view(view, view_type, detail_page='detail', base_url='/', title=None, live_url=None, **kwargs):
     media_type = {ViewType.markdown: 'text/markdown'}.get(view_type, 'text/html')
     stage1 = stage2 = view[view_type]
     if view_type is ViewType.page:
@@ -586,12 +1359,69 @@ def render_view(view, view_type, detail_page='detail', base_url='/', title=None,
     def report_url(report, *args, **kwargs): return _build_report_url(base_url, report, *args, **kwargs)  # noqa: E306,E704
     fragment = templates_map[stage1].render(base_url=base_url, detail_url=detail_url, report_url=report_url, scope_url=scope_url, **kwargs)
     if view_type != ViewType.markdown and stage1.endswith('.md'):
-        fragment = markdown(fragment, extensions=['extra'])
+        fragment = markdown_to_html(fragment)
     if stage1 != stage2:
-        fragment = templates_map[stage2].render(fragment=fragment, title=title)
+        # if `live_url` is given, the page will replace the fragment by the one from this url upon new results
+        events_url = f"{base_url}events" if live_url else None
+        fragment = templates_map[stage2].render(fragment=fragment, title=title, live_url=live_url, events_url=events_url)
     return Response(content=fragment, media_type=media_type)
 
 
+def negotiate_encoding(accept_encoding):
+    """return preferred item of `ENCODINGS` that is acceptable according to `accept_encoding`, or None"""
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    default = qualities.get('*', 0.0)
+    candidates = [encoding for encoding in ENCODINGS if qualities.get(encoding, default) > 0]
+    if not candidates:
+        return None
+    # `max` returns the first one among equals, so this respects the order of preference
+    return max(candidates, key=lambda encoding: qualities.get(encoding, default))
+
+
+def _encode(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content)
+    return gzip.compress(content, mtime=0)
+
+
+def cached_view(key, make_response, accept_encoding=''):
+    """return response for `key`, using `make_response` to create it unless it's still in the cache
+
+    The `key` must contain all parameters that the response depends on, including the data generation
+    (see `get_generation`) where applicable. The cache is bounded (least recently used are dropped).
+
+    The response body is compressed according to `accept_encoding` (the header of the request); the
+    compressed variants are kept in the cache as well, so each one is computed only once per entry.
+    """
+    cached = _view_cache.get(key)
+    if cached is None:
+        response = make_response()
+        cached = _view_cache[key] = response.body, response.media_type, {}
+        while len(_view_cache) > VIEW_CACHE_SIZE:
+            _view_cache.popitem(last=False)
+    else:
+        _view_cache.move_to_end(key)
+    content, media_type, variants = cached
+    headers = {'Vary': 'Accept-Encoding'}
+    encoding = negotiate_encoding(accept_encoding) if len(content) >= COMPRESS_MIN_SIZE else None
+    if encoding is not None:
+        content = variants.get(encoding)
+        if content is None:
+            content = variants[encoding] = _encode(cached[0], encoding)
+        headers['Content-Encoding'] = encoding
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
 def _redact_report(report):
     """remove all lines from script output in `report` that are not directly linked to any testcase"""
     if 'run' not in report or 'invocations' not in report['run']:
@@ -614,10 +1444,19 @@ def _redact_report(report):
 @app.get("/{view_type}/report/{report_uuid}")
 async def get_report_view(
     request: Request,
-    conn: Annotated[connection, Depends(get_conn)],
+    conn: Annotated[connection, Depends(get_read_conn)],
     view_type: ViewType,
     report_uuid: str,
 ):
+    # reports don't change, so only the templates are relevant to the cache (cf. `get_generation`)
+    return cached_view(
+        ('report', view_type, report_uuid, _static_generation),
+        lambda: _make_report_view(conn, view_type, report_uuid),
+        request.headers.get('accept-encoding', ''),
+    )
+
+
+def _make_report_view(conn, view_type, report_uuid):
     with conn.cursor() as cur:
         specs = db_get_report(cur, report_uuid)
     if not specs:
@@ -634,7 +1473,7 @@ async def get_report_view(
 async def get_report_view_full(
     request: Request,
     account: Annotated[Optional[tuple[str, str]], Depends(auth)],
-    conn: Annotated[connection, Depends(get_conn)],
+    conn: Annotated[connection, Depends(get_read_conn)],
     view_type: ViewType,
     report_uuid: str,
 ):
@@ -671,16 +1510,26 @@ def _resolve_scope(scopeuuid):
 @app.get("/{view_type}/detail/{subject}/{scopeuuid}")
 async def get_detail(
     request: Request,
-    conn: Annotated[connection, Depends(get_conn)],
+    conn: Annotated[connection, Depends(get_read_conn)],
     view_type: ViewType,
     subject: str,
     scopeuuid: str,
 ):
-    return _make_detail_view(conn, view_type, subject, scopeuuid)
+    return _make_detail_view(conn, view_type, subject, scopeuuid, request.headers.get('accept-encoding', ''))
 
 
-def _make_detail_view(conn, view_type, subject, scopeuuid, include_drafts=False):
+def _make_detail_view(conn, view_type, subject, scopeuuid, accept_encoding='', include_drafts=False):
     scopeuuid = _resolve_scope(scopeuuid)
+    with conn.cursor() as cur:
+        generation = get_generation(cur)
+    return cached_view(
+        ('detail', view_type, subject, scopeuuid, include_drafts, generation),
+        lambda: _render_detail_view(conn, view_type, subject, scopeuuid, include_drafts),
+        accept_encoding,
+    )
+
+
+def _render_detail_view(conn, view_type, subject, scopeuuid, include_drafts):
     with conn.cursor() as cur:
         group, subjects = _resolve_group(cur, subject)
         rows2 = []
@@ -701,54 +1550,120 @@ def _make_detail_view(conn, view_type, subject, scopeuuid, include_drafts=False)
 @app.get("/{view_type}/detail_full/{subject}/{scopeuuid}")
 async def get_detail_full(
     request: Request,
-    conn: Annotated[connection, Depends(get_conn)],
+    conn: Annotated[connection, Depends(get_read_conn)],
     view_type: ViewType,
     subject: str,
     scopeuuid: str,
 ):
-    return _make_detail_view(conn, view_type, subject, scopeuuid, include_drafts=True)
+    return _make_detail_view(
+        conn, view_type, subject, scopeuuid, request.headers.get('accept-encoding', ''), include_drafts=True,
+    )
 
 
 @app.get("/{view_type}/table")
 async def get_table(
     request: Request,
-    conn: Annotated[connection, Depends(get_conn)],
+    conn: Annotated[connection, Depends(get_read_conn)],
     view_type: ViewType,
 ):
-    return _make_table_view(conn, view_type, detail_page='detail')
+    return _make_table_view(conn, view_type, 'detail', request.headers.get('accept-encoding', ''))
+
 
+def get_generation(cur):
+    """return a value that changes whenever the evaluation of the current results may change
+
+    This is the case if results are added or approved, if the static config is reloaded, or if the day
+    changes (results expire at midnight; see `add_period`; validity of versions changes by date).
+    """
+    return db_get_generation(cur), date.today(), _static_generation
+
+
+def compute_summaries(results, groups):
+    """compute summary (see `summary_filter`) for each pair (subject or group, scope uuid) in `results`"""
+    summaries = {}
+    scopeuuids = set()
+    for subject, subject_result in results.items():
+        for scopeuuid, scope_result in subject_result.items():
+            summaries[(subject, scopeuuid)] = summary_filter(scope_result)
+            scopeuuids.add(scopeuuid)
+    for group, subjects in groups.items():
+        for scopeuuid in scopeuuids:
+            summaries[(GROUP_PREFIX + group, scopeuuid)] = summary_filter([
+                results.get(subject, {}).get(scopeuuid, {})
+                for subject in subjects
+            ])
+    return summaries
+
+
+def get_evaluation(cur, include_drafts=False):
+    """return evaluation of all current results, along with groups and summaries, once per generation"""
+    generation = get_generation(cur)
+    cached = _evaluation_cache.get(include_drafts)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+    groups = db_get_groups(cur)
+    # stream the rows (there is one per subject, scope, version, and testcase)
+    with scan_cursor(cur.connection, 'evaluation') as scan:
+        rows2 = db_get_relevant_results2(scan)
+        results2 = convert_result_rows_to_dict2(
+            rows2, get_scopes(), include_report=True, include_drafts=include_drafts,
+        )
+    evaluation = {'results': results2, 'groups': groups, 'summaries': compute_summaries(results2, groups)}
+    _evaluation_cache[include_drafts] = generation, evaluation
+    return evaluation
 
-def _make_table_view(conn, view_type, detail_page, include_drafts=False):
+
+def _make_table_view(conn, view_type, detail_page, accept_encoding='', include_drafts=False):
+    with conn.cursor() as cur:
+        generation = get_generation(cur)
+    return cached_view(
+        ('table', view_type, detail_page, include_drafts, generation),
+        lambda: _render_table_view(conn, view_type, detail_page, include_drafts),
+        accept_encoding,
+    )
+
+
+def _render_table_view(conn, view_type, detail_page, include_drafts):
     with conn.cursor() as cur:
-        groups = db_get_groups(cur)
-        rows2 = db_get_relevant_results2(cur)
-    results2 = convert_result_rows_to_dict2(rows2, get_scopes(), include_drafts=include_drafts)
+        evaluation = get_evaluation(cur, include_drafts=include_drafts)
     title = 'SCS compliance overview'
     if include_drafts:
         title += ' (incl. drafts)'
+    live_url = f"{settings.base_url}fragment/{'table_full' if include_drafts else 'table'}"
     return render_view(
-        VIEW_TABLE, view_type, results=results2, base_url=settings.base_url, detail_page=detail_page,
-        title=title, groups=groups,
+        VIEW_TABLE, view_type, base_url=settings.base_url, detail_page=detail_page,
+        title=title, live_url=live_url, **evaluation,
     )
 
 
 @app.get("/{view_type}/table_full")
 async def get_table_full(
     request: Request,
-    conn: Annotated[connection, Depends(get_conn)],
+    conn: Annotated[connection, Depends(get_read_conn)],
     view_type: ViewType,
 ):
-    return _make_table_view(conn, view_type, detail_page='detail_full', include_drafts=True)
+    return _make_table_view(
+        conn, view_type, 'detail_full', request.headers.get('accept-encoding', ''), include_drafts=True,
+    )
 
 
 @app.get("/{view_type}/scope/{scopeuuid}")
 async def get_scope(
     request: Request,
-    conn: Annotated[connection, Depends(get_conn)],
+    conn: Annotated[connection, Depends(get_read_conn)],
     view_type: ViewType,
     scopeuuid: str,
 ):
     scopeuuid = _resolve_scope(scopeuuid)
+    # the scope view only depends on the static config and the validity of the versions (i.e., the date)
+    return cached_view(
+        ('scope', view_type, scopeuuid, date.today(), _static_generation),
+        lambda: _make_scope_view(view_type, scopeuuid),
+        request.headers.get('accept-encoding', ''),
+    )
+
+
+def _make_scope_view(view_type, scopeuuid):
     spec = get_scopes()[scopeuuid]
     versions = spec['versions']
     # use same order as in details view
@@ -773,7 +1688,7 @@ async def get_scope(
 async def get_results(
     request: Request,
     account: Annotated[tuple[str, str], Depends(auth)],
-    conn: Annotated[connection, Depends(get_conn)],
+    conn: Annotated[connection, Depends(get_read_conn)],
     approved: Optional[bool] = None, limit: int = 10, skip: int = 0,
 ):
     """get recent results, potentially filtered by approval status"""
@@ -787,6 +1702,7 @@ async def post_results(
     request: Request,
     account: Annotated[tuple[str, str], Depends(auth)],
     conn: Annotated[connection, Depends(get_conn)],
+    response: Response,
 ):
     """post approvals to this endpoint"""
     check_role(account, roles=ROLES['approve'])
@@ -796,10 +1712,51 @@ async def post_results(
     body = await request.body()
     document = json.loads(body.decode("utf-8"))
     records = [document] if isinstance(document, dict) else document
+    statuses = ['invalid'] * len(records)
+    valid = [
+        idx for idx, record in enumerate(records)
+        if isinstance(record, dict) and all(key in record for key in APPROVAL_KEYS)
+    ]
+    # NOTE the rollup need not be updated because it doesn't depend on the approval (see `_update_rollup`)
+    changed = False
     with conn.cursor() as cur:
-        for record in records:
-            db_patch_approval2(cur, record)
+        updated = db_patch_approvals2(cur, [records[idx] for idx in valid]) if valid else []
+        for idx, keys in zip(valid, updated):
+            statuses[idx] = 'ok' if keys else 'not found'
+            changed = changed or bool(keys)
+        generation = db_bump_generation(cur) if changed else None
     conn.commit()
+    if generation is not None:
+        set_written_cookie(response, generation)
+    return [{'status': status} for status in statuses]
+
+
+@app.post("/results/approve")
+async def post_results_approve(
+    request: Request,
+    account: Annotated[tuple[str, str], Depends(auth)],
+    conn: Annotated[connection, Depends(get_conn)],
+    response: Response,
+    approval: bool = True, reportuuid: str = None, subject: str = None, scopeuuid: str = None,
+    version: str = None, check: str = None, result: int = None, before: Optional[date] = None,
+):
+    """set approval for all results matching the filter given via query parameters"""
+    check_role(account, roles=ROLES['approve'])
+    if reportuuid is None and subject is None:
+        raise HTTPException(status_code=400, detail="need to restrict at least reportuuid or subject")
+    if scopeuuid is not None:
+        scopeuuid = _resolve_scope(scopeuuid)
+    with conn.cursor() as cur:
+        updated = db_patch_approval_filtered2(
+            cur, approval, reportuuid=reportuuid, subject=subject, scopeuuid=scopeuuid, version=version,
+            testcase=check, result=result, before=before,
+        )
+        # NOTE the rollup need not be updated because it doesn't depend on the approval (see `_update_rollup`)
+        generation = db_bump_generation(cur) if updated else None
+    conn.commit()
+    if generation is not None:
+        set_written_cookie(response, generation)
+    return {'updated': sum(count for *_, count in updated)}
 
 
 @app.get("/healthz")
@@ -833,6 +1790,15 @@ def pick_filter(ctx, results, scopeuuid, *subjects):
     return [r for r in rs if r is not None]
 
 
+def lookup_summary_filter(summaries, scopeuuid, subject):
+    """Jinja filter to look up summary for given `scope` and `subject` (or group) in `summaries`
+
+    The lookup `summaries` is the one precomputed by `compute_summaries`; it supersedes
+    using the filters `pick` and `summary` in succession.
+    """
+    return summaries.get((subject, _resolve_scope(scopeuuid)), SUMMARY_NONE)
+
+
 NIL = object()  # the version in question does not have a result
 # used to sort multiple versions according to the "goodness" of their result
 RESULT_SCORE = {
@@ -842,6 +1808,7 @@ RESULT_SCORE = {
     0: 3,
     1: 4,
 }
+SUMMARY_NONE = '🛑 –'  # summary in case no results are present
 COLOR_MAP = {
     -1: '🛑',  # fail
     None: '🟧',  # missing
@@ -862,7 +1829,7 @@ def summary_filter(scope_results):
             key=lambda sr: RESULT_SCORE[sr.get('result', NIL)],
         )
     if not scope_results:
-        return '🛑 –'
+        return SUMMARY_NONE
     result = scope_results['result']
     color = COLOR_MAP[result]
     # if the result is not pass anyway, deduct points if the version is outdated
@@ -877,6 +1844,16 @@ def summary_filter(scope_results):
     return f'{color} {passed_str}'
 
 
+@lru_cache(maxsize=MARKDOWN_CACHE_SIZE)
+def markdown_to_html(text):
+    """convert `text` from Markdown to HTML
+
+    The conversion is by far the most expensive part of rendering a view, and the same Markdown is often
+    converted more than once (for instance, for fragment and page of the same view, cf. `cached_view`).
+    """
+    return markdown(text, extensions=['extra'])
+
+
 def verdict_check_filter(value):
     """Jinja filter to turn a canonical result value into a symbolic verdict (✔, ⚠, or ✘)"""
     # be fault-tolerant here and turn every non-canonical value into a MISS
@@ -890,30 +1867,41 @@ def short_isodate_filter(value):
 
 def reload_static_config(*args, do_ensure_schema=False):
     # allow arbitrary arguments so it can readily be used as signal handler
+    global _scopes
     logger.info("loading static config")
     scopes = {}
-    import_cert_yaml_dir(settings.yaml_path, scopes)
-    # import successful: only NOW destructively update global _scopes
-    _scopes.clear()
-    _scopes.update(scopes)
-    import_templates(settings.template_path, env=env, templates=templates_map)
+    with _scopes_lock:
+        # unchanged specs are taken from the cache, and they are shared with the current scopes,
+        # so annotating their validity (done by the import) must not interfere with `get_scopes`
+        import_cert_yaml_dir(settings.yaml_path, scopes, cache=_spec_cache)
+        # import successful: only NOW replace global _scopes (in one go, so that readers never see a partial dict)
+        _scopes = scopes
+    import_templates(settings.template_path, env=env, templates=templates_map, cache=_template_cache)
     validate_templates(templates=templates_map)
     with mk_conn(settings=settings) as conn:
         if do_ensure_schema:
             db_ensure_schema(conn)
-        import_bootstrap(settings.bootstrap_path, conn=conn)
+        import_bootstrap(settings.bootstrap_path, conn=conn, cache=_bootstrap_cache)
+    # invalidate anything that has been computed from the previous config (see `get_generation`)
+    global _static_generation
+    _static_generation += 1
 
 
-if __name__ == "__main__":
-    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
+def register_filters(env):
     env.filters.update(
         pick=pick_filter,
         summary=summary_filter,
+        lookup_summary=lookup_summary_filter,
         verdict_check=verdict_check_filter,
         markdown=markdown,
         validity_symbol=ASTERISK_LOOKUP.get,
         short_isodate=short_isodate_filter,
     )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
+    register_filters(env)
     reload_static_config(do_ensure_schema=True)
     signal.signal(signal.SIGHUP, reload_static_config)
     uvicorn.run(app, host='0.0.0.0', port=8080, log_level="info", workers=1)
@@ -0,0 +1,143 @@
+"""
+Regression tests for monitor.py
+
+Tests that need a database are skipped unless one is available as given by the environment variables
+`SCM_DB_HOST` etc. (see `Settings`); they roll back whatever they write, but only use a throwaway database
+all the same.
+
+SPDX-License-Identifier: CC-BY-SA 4.0
+"""
+
+from datetime import date, datetime, timedelta
+import json
+import os.path
+import uuid
+
+import psycopg2
+import pytest
+
+import monitor
+from monitor import (
+    SCOPE_ALIASES, add_period, convert_result_rows_to_dict2, fill_rollup, import_bootstrap, import_cert_yaml_dir,
+    ingest_reports, mk_conn,
+)
+from sql import (
+    db_ensure_schema, db_get_account_state, db_get_relevant_results2, db_get_rollup2, db_patch_approvals2,
+    db_remove_accounts,
+)
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+IAAS = SCOPE_ALIASES['scs-compatible-iaas']
+SUBJECT = 'test-subject'
+
+
+@pytest.fixture(scope='module', autouse=True)
+def scopes():
+    scopes = {}
+    import_cert_yaml_dir(os.path.join(HERE, '..', 'Tests'), scopes)
+    monitor._scopes = scopes
+    return scopes
+
+
+@pytest.fixture
+def conn():
+    try:
+        conn = mk_conn()
+    except psycopg2.OperationalError:
+        pytest.skip("database not available")
+    try:
+        db_ensure_schema(conn)
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def ingest(conn, checked_at, result, subject=SUBJECT, scopeuuid=IAAS):
+    """ingest report for `subject` checked at `checked_at` that has `result` for each testcase of the scope
+
+    Returns the uuid of the report.
+    """
+    document = {
+        'subject': subject,
+        'checked_at': checked_at.isoformat(),
+        'spec': {'uuid': scopeuuid},
+        'run': {'uuid': str(uuid.uuid4()), 'invocations': {'inv-0': {'results': {
+            tc_id: result for tc_id in monitor.get_scopes()[scopeuuid]['testcases']
+        }}}},
+    }
+    with conn.cursor() as cur:
+        ingest_reports(cur, (subject, 0), 'application/x-signed-json', json.dumps(document))
+    return document['run']['uuid']
+
+
+def get_rollup(conn, subject=SUBJECT, scopeuuid=IAAS):
+    """return mapping from day to overall result of the rollup for `subject` and `scopeuuid`"""
+    with conn.cursor() as cur:
+        rows = db_get_rollup2(cur, subject, scopeuuid)
+    return {day: result for day, _, _, version, result in rows if version == ''}
+
+
+class UncommittedConnection:
+    """wrapper of `conn` whose method `commit` does nothing, so everything can be rolled back in the end"""
+    def __init__(self, conn):
+        self.conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return self.conn.cursor(*args, **kwargs)
+
+    def commit(self):
+        pass
+
+
+def test_bootstrap_corrects_database_even_if_unchanged(conn, tmp_path):
+    bootstrap_path = tmp_path / 'bootstrap.yaml'
+    bootstrap_path.write_text('accounts:\n  - subject: test-account\n    roles: [read_any]\n')
+    cache = {}
+    import_bootstrap(bootstrap_path, UncommittedConnection(conn), cache=cache)
+    with conn.cursor() as cur:
+        assert db_get_account_state(cur)['test-account']['roles'] == monitor.ROLES['read_any']
+        db_remove_accounts(cur, ['test-account'])
+    import_bootstrap(bootstrap_path, UncommittedConnection(conn), cache=cache)
+    with conn.cursor() as cur:
+        assert 'test-account' in db_get_account_state(cur)
+
+
+def test_result_counts_on_its_last_valid_day(scopes):
+    tc_id = 'scs-0100-syntax-check'
+    checked_at = datetime(2025, 6, 2, 10)
+    expiry = add_period(checked_at, scopes[(IAAS, tc_id)].get('lifetime'))
+    rows = [(SUBJECT, IAAS, '*', tc_id, 1, checked_at, 'report')]
+
+    def evaluate(checkdate):
+        results = convert_result_rows_to_dict2(rows, scopes, subjects=(SUBJECT, ), scopes=(IAAS, ), checkdate=checkdate)
+        return results[SUBJECT][IAAS]['results']
+
+    assert tc_id in evaluate(expiry.date() - timedelta(days=1))
+    assert tc_id not in evaluate(expiry.date())
+
+
+def test_late_report_updates_rollup_beyond_its_day(conn):
+    day = date.today() - timedelta(days=5)
+    ingest(conn, datetime.combine(day - timedelta(days=2), datetime.min.time()) + timedelta(hours=12), -1)
+    # the rollup is extended beyond `day` before the report for `day` arrives
+    fill_rollup(conn, day + timedelta(days=2))
+    assert get_rollup(conn)[day + timedelta(days=2)] == -1
+    ingest(conn, datetime.combine(day, datetime.min.time()) + timedelta(hours=23, minutes=59), 1)
+    rollup = get_rollup(conn)
+    assert rollup[day - timedelta(days=1)] == -1
+    assert [rollup[day + timedelta(days=n)] for n in range(3)] == [1, 1, 1]
+
+
+def test_duplicate_approval_is_applied_once_and_found_twice(conn):
+    report_uuid = ingest(conn, datetime.now() - timedelta(hours=1), -1)
+    record = {'reportuuid': report_uuid, 'scopeuuid': IAAS, 'version': '*', 'check': 'scs-0100-syntax-check'}
+    other = {**record, 'check': 'no-such-testcase', 'approval': True}
+    with conn.cursor() as cur:
+        updated = db_patch_approvals2(cur, [{**record, 'approval': True}, other, {**record, 'approval': False}])
+        assert [len(keys) for keys in updated] == [1, 0, 1]
+        updated = db_patch_approvals2(cur, [{**record, 'approval': False}, {**record, 'approval': True}])
+        assert [len(keys) for keys in updated] == [1, 1]
+        approved = {row[3] for row in db_get_relevant_results2(cur, SUBJECT, IAAS, approved_only=True)}
+    assert approved == {'scs-0100-syntax-check'}
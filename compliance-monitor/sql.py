@@ -1,11 +1,15 @@
 from collections import defaultdict
+import json
 
 from psycopg2 import sql
 from psycopg2.extensions import cursor, connection
+from psycopg2.extras import execute_values
 
 # list schema versions in ascending order
 SCHEMA_VERSION_KEY = 'version'
-SCHEMA_VERSIONS = ['v1', 'v2', 'v3', 'v4']
+# key of the counter that is increased whenever results change (so dependent data can be cached)
+GENERATION_KEY = 'generation'
+SCHEMA_VERSIONS = ['v1', 'v2', 'v3', 'v4', 'v5', 'v6', 'v7']
 # use ... (Ellipsis) here to indicate that no default value exists (will lead to error if no value is given)
 ACCOUNT_DEFAULTS = {'subject': ..., 'api_key': ..., 'roles': ..., 'group': None}
 PUBLIC_KEY_DEFAULTS = {'public_key': ..., 'public_key_type': ..., 'public_key_name': ...}
@@ -145,6 +149,51 @@ def db_ensure_schema_v4(cur: cursor):
     ''')
 
 
+def db_ensure_schema_v5(cur: cursor):
+    # start from v4, add index to support finding the latest results up to some point in time
+    db_ensure_schema_v4(cur)
+    cur.execute('''
+    CREATE INDEX IF NOT EXISTS result2_subject_scope_checked_at
+    ON result2 (subject, scopeuuid, version, testcase, checked_at DESC);
+    ''')
+
+
+def db_ensure_schema_v6(cur: cursor):
+    # start from v5, add table for daily rollup of evaluated results
+    db_ensure_schema_v5(cur)
+    cur.execute('''
+    -- this table is redundant: it can be recomputed from table result2 (given the scope specs)
+    CREATE TABLE IF NOT EXISTS rollup2 (
+        day date NOT NULL,
+        subject text NOT NULL,
+        scopeuuid text NOT NULL,
+        version text NOT NULL,  -- the empty string denotes the overall result for the scope
+        result int,
+        PRIMARY KEY (subject, scopeuuid, version, day)
+    );
+    ''')
+
+
+def db_ensure_schema_v7(cur: cursor):
+    # start from v6, add table for the ingestion queue
+    db_ensure_schema_v6(cur)
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS job (
+        jobid SERIAL PRIMARY KEY,
+        status text NOT NULL DEFAULT 'queued',  -- one of queued, done, failed
+        created_at timestamp NOT NULL DEFAULT LOCALTIMESTAMP,
+        finished_at timestamp,
+        subject text NOT NULL,  -- subject of the account that posted the payload
+        roles integer NOT NULL,  -- roles of that account at the time of posting
+        content_type text NOT NULL,
+        payload text,  -- signature already verified; removed when the job is finished
+        result jsonb,  -- list of statuses per document if done, error detail if failed
+        generation bigint  -- data generation after the job is done
+    );
+    CREATE INDEX IF NOT EXISTS job_queued ON job (jobid) WHERE status = 'queued';
+    ''')
+
+
 def db_upgrade_data_v1_v2(cur):
     # we are going to drop table result, but use delete anyway to have the transaction safety
     cur.execute('''
@@ -188,6 +237,23 @@ def db_set_schema_version(cur: cursor, version: str):
     ;''', (SCHEMA_VERSION_KEY, version))
 
 
+def db_get_generation(cur: cursor):
+    cur.execute('''SELECT value FROM meta WHERE key = %s;''', (GENERATION_KEY, ))
+    return int(cur.rowcount and cur.fetchone()[0] or 0)
+
+
+def db_bump_generation(cur: cursor):
+    cur.execute('''
+    INSERT INTO meta (key, value)
+    VALUES (%s, '1')
+    ON CONFLICT (key)
+    DO UPDATE
+    SET value = (meta.value::bigint + 1)::text
+    RETURNING value
+    ;''', (GENERATION_KEY, ))
+    return int(cur.fetchone()[0])
+
+
 def db_upgrade_schema(conn: connection, cur: cursor):
     # the ensure_* and post_upgrade_* functions must be idempotent
     # ditto for the data transfer (ideally insert/delete transaction)
@@ -199,8 +265,8 @@ def db_upgrade_schema(conn: connection, cur: cursor):
         if current is None:
             # this is an empty db, but it also used to be the case with v1
             # I (mbuechse) made sure manually that the value v1 is set on running installations
-            db_ensure_schema_v4(cur)
-            db_set_schema_version(cur, 'v4')
+            db_ensure_schema_v7(cur)
+            db_set_schema_version(cur, 'v7')
             conn.commit()
             break  # Nothing more to do, we bootstrapped with the latest schema version
         elif current == 'v1':
@@ -220,6 +286,18 @@ def db_upgrade_schema(conn: connection, cur: cursor):
             db_ensure_schema_v4(cur)
             db_set_schema_version(cur, 'v4')
             conn.commit()
+        elif current == 'v4':
+            db_ensure_schema_v5(cur)
+            db_set_schema_version(cur, 'v5')
+            conn.commit()
+        elif current == 'v5':
+            db_ensure_schema_v6(cur)
+            db_set_schema_version(cur, 'v6')
+            conn.commit()
+        elif current == 'v6':
+            db_ensure_schema_v7(cur)
+            db_set_schema_version(cur, 'v7')
+            conn.commit()
         elif current >= SCHEMA_VERSIONS[-1]:  # bail if version is too new (but hope it's compatible)
             break
 
@@ -255,16 +333,34 @@ def db_update_account(cur: cursor, record: dict):
     return accountid
 
 
-def db_filter_accounts(cur: cursor, predicate: callable):
-    cur.execute('SELECT accountid FROM account;')
-    removeids = [row[0] for row in cur.fetchall() if not predicate(*row)]
-    while removeids:
-        cur.execute('DELETE FROM account WHERE accountid IN %s', (tuple(removeids[:10]), ))
-        del removeids[:10]
+def db_remove_accounts(cur: cursor, subjects):
+    cur.execute('DELETE FROM account WHERE subject IN %s;', (tuple(subjects), ))
 
 
-def db_clear_delegates(cur: cursor, accountid):
-    cur.execute('''DELETE FROM delegation WHERE accountid = %s;''', (accountid, ))
+def db_get_account_state(cur: cursor):
+    """return snapshot of everything managed by the bootstrap file, i.e., accounts and what belongs to them"""
+    cur.execute('''SELECT accountid, subject, roles, "group" FROM account;''')
+    state = {
+        subject: {
+            'accountid': accountid, 'roles': roles, 'group': group,
+            'delegates': set(), 'api_keys': set(), 'keys': {},
+        }
+        for accountid, subject, roles, group in cur.fetchall()
+    }
+    by_id = {record['accountid']: record for record in state.values()}
+    cur.execute('''
+    SELECT delegation.accountid, account.subject
+    FROM delegation
+    JOIN account ON account.accountid = delegation.delegateid;''')
+    for accountid, delegate in cur.fetchall():
+        by_id[accountid]['delegates'].add(delegate)
+    cur.execute('SELECT accountid, apikeyhash FROM apikey;')
+    for accountid, apikey_hash in cur.fetchall():
+        by_id[accountid]['api_keys'].add(apikey_hash)
+    cur.execute('SELECT accountid, keyname, key, keytype FROM publickey;')
+    for accountid, keyname, key, keytype in cur.fetchall():
+        by_id[accountid]['keys'][keyname] = (key, keytype)
+    return state
 
 
 def db_add_delegate(cur: cursor, accountid, delegate):
@@ -276,6 +372,15 @@ def db_add_delegate(cur: cursor, accountid, delegate):
     RETURNING accountid;''', (accountid, delegate))
 
 
+def db_remove_delegates(cur: cursor, accountid, delegates):
+    cur.execute('''
+    DELETE FROM delegation
+    USING account
+    WHERE delegation.accountid = %s
+      AND delegation.delegateid = account.accountid
+      AND account.subject IN %s;''', (accountid, tuple(delegates)))
+
+
 def db_find_subjects(cur: cursor, delegate):
     cur.execute('''
     SELECT a.subject
@@ -312,12 +417,11 @@ def db_update_apikey(cur: cursor, accountid, apikey_hash):
     return apikeyid
 
 
-def db_filter_apikeys(cur: cursor, accountid, predicate: callable):
-    cur.execute('SELECT apikeyid FROM apikey WHERE accountid = %s;', (accountid, ))
-    removeids = [row[0] for row in cur.fetchall() if not predicate(*row)]
-    while removeids:
-        cur.execute('DELETE FROM apikey WHERE apikeyid IN %s', (tuple(removeids[:10]), ))
-        del removeids[:10]
+def db_remove_apikeys(cur: cursor, accountid, apikey_hashes):
+    cur.execute(
+        'DELETE FROM apikey WHERE accountid = %s AND apikeyhash IN %s;',
+        (accountid, tuple(apikey_hashes)),
+    )
 
 
 def db_update_publickey(cur: cursor, accountid, record: dict):
@@ -335,12 +439,11 @@ def db_update_publickey(cur: cursor, accountid, record: dict):
     return keyid
 
 
-def db_filter_publickeys(cur: cursor, accountid, predicate: callable):
-    cur.execute('SELECT keyid, keyname FROM publickey WHERE accountid = %s;', (accountid, ))
-    removeids = [row[0] for row in cur.fetchall() if not predicate(*row)]
-    while removeids:
-        cur.execute('DELETE FROM publickey WHERE keyid IN %s', (tuple(removeids[:10]), ))
-        del removeids[:10]
+def db_remove_publickeys(cur: cursor, accountid, keynames):
+    cur.execute(
+        'DELETE FROM publickey WHERE accountid = %s AND keyname IN %s;',
+        (accountid, tuple(keynames)),
+    )
 
 
 def db_get_report(cur: cursor, report_uuid):
@@ -363,13 +466,15 @@ def db_get_reports(cur: cursor, subject, limit, skip):
 
 
 def db_insert_report(cur: cursor, uuid, checked_at, subject, json_text):
+    """insert report and return its id, or return None if a report with the same uuid is already present"""
     # this is an exception in that we don't use a record parameter (it's just not as practical here)
     cur.execute('''
     INSERT INTO report (reportuuid, checked_at, subject, data)
     VALUES (%s, %s, %s, %s)
+    ON CONFLICT (reportuuid) DO NOTHING
     RETURNING reportid;''', (uuid, checked_at, subject, json_text))
-    reportid, = cur.fetchone()
-    return reportid
+    row = cur.fetchone()
+    return None if row is None else row[0]
 
 
 def db_insert_result2(
@@ -386,9 +491,15 @@ def db_insert_result2(
 
 def db_get_relevant_results2(
     cur: cursor,
-    subject=None, scopeuuid=None, version=None, approved_only=False,
+    subject=None, scopeuuid=None, version=None, approved_only=False, until=None,
 ):
-    """for each combination of scope/version/check, get the most recent test result that is still valid"""
+    """for each combination of scope/version/check, get the most recent test result that is still valid
+
+    If `until` is given, only consider results that were checked before that point in time.
+
+    Returns an iterator over the rows (namely, `cur` itself) that must be consumed before `cur` is used
+    again; use a named (server-side) cursor to avoid having the whole result set in memory at once.
+    """
     # find the latest result per subject/scopeuuid/version/checkid for this subject
     # DISTINCT ON is a Postgres-specific construct that comes in very handy here :)
     cur.execute(sql.SQL('''
@@ -404,9 +515,56 @@ def db_get_relevant_results2(
             None if scopeuuid is None else sql.SQL('scopeuuid = %(scopeuuid)s'),
             None if version is None else sql.SQL('version = %(version)s'),
             None if subject is None else sql.SQL('result2.subject = %(subject)s'),
+            None if until is None else sql.SQL('result2.checked_at < %(until)s'),
         ),
-    ), {"subject": subject, "scopeuuid": scopeuuid, "version": version})
-    return cur.fetchall()
+    ), {"subject": subject, "scopeuuid": scopeuuid, "version": version, "until": until})
+    return cur
+
+
+def db_get_results_history2(cur: cursor, subject, scopeuuid, since, until):
+    """list all test results for `subject` and `scopeuuid` checked within [since, until), oldest first
+
+    Returns an iterator over the rows (cf. `db_get_relevant_results2`).
+    """
+    cur.execute('''
+    SELECT result2.subject, scopeuuid, version, testcase, result, result2.checked_at, report.reportuuid
+    FROM result2
+    JOIN report ON report.reportid = result2.reportid
+    WHERE result2.subject = %(subject)s
+      AND scopeuuid = %(scopeuuid)s
+      AND result2.checked_at >= %(since)s
+      AND result2.checked_at < %(until)s
+    ORDER BY result2.checked_at;
+    ''', {"subject": subject, "scopeuuid": scopeuuid, "since": since, "until": until})
+    return cur
+
+
+def db_export_results2(cur: cursor, subject=None, scopeuuid=None, since=None, until=None, chunk_size=10000):
+    """yield lists of (at most `chunk_size`) test results joined with report uuid, ordered by result id
+
+    Use a named (server-side) cursor so that only one chunk at a time is held in memory.
+    """
+    # NOTE don't select anything from report.data: this would decompress the whole report for each result
+    cur.execute(sql.SQL('''
+    SELECT result2.resultid, result2.checked_at, result2.subject, scopeuuid,
+    version, testcase, result, approval, report.reportuuid
+    FROM result2
+    JOIN report ON report.reportid = result2.reportid
+    {filter_condition}
+    ORDER BY result2.resultid;
+    ''').format(
+        filter_condition=make_where_clause(
+            None if subject is None else sql.SQL('result2.subject = %(subject)s'),
+            None if scopeuuid is None else sql.SQL('scopeuuid = %(scopeuuid)s'),
+            None if since is None else sql.SQL('result2.checked_at >= %(since)s'),
+            None if until is None else sql.SQL('result2.checked_at < %(until)s'),
+        ),
+    ), {"subject": subject, "scopeuuid": scopeuuid, "since": since, "until": until})
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
 
 
 def db_get_recent_results2(cur: cursor, approved, limit, skip, max_age_days=None):
@@ -430,16 +588,171 @@ def db_get_recent_results2(cur: cursor, approved, limit, skip, max_age_days=None
     return [{col: val for col, val in zip(columns, row)} for row in cur.fetchall()]
 
 
-def db_patch_approval2(cur: cursor, record):
+def db_patch_approvals2(cur: cursor, records):
+    """set approval for each of the given `records` in one go
+
+    Returns list with one entry per record: list of triples (subject, scopeuuid, day) of updated results.
+    """
+    columns = ('reportuuid', 'scopeuuid', 'version', 'check')
+    # each result must only occur once in the update, for otherwise it would only match one of its occurrences;
+    # if it occurs multiple times, the last approval given wins (just as if the records were applied in turn)
+    approvals = {}  # map key of result to approval
+    for record in records:
+        approvals[tuple(record[col] for col in columns)] = record['approval']
+    positions = {key: idx for idx, key in enumerate(approvals)}
+    arrays = {col: [key[num] for key in approvals] for num, col in enumerate(columns)}
+    arrays['approval'] = list(approvals.values())
     cur.execute('''
     UPDATE result2
-    SET approval = %(approval)s
-    FROM report
-    WHERE report.reportuuid = %(reportuuid)s
+    SET approval = r.approval
+    FROM report, unnest(
+        %(reportuuid)s::text[], %(scopeuuid)s::text[], %(version)s::text[], %(check)s::text[],
+        %(approval)s::boolean[]
+    ) WITH ORDINALITY AS r(reportuuid, scopeuuid, version, testcase, approval, idx)
+    WHERE report.reportuuid = r.reportuuid
       AND result2.reportid = report.reportid
-      AND result2.scopeuuid = %(scopeuuid)s
-      AND result2.version = %(version)s
-      AND result2.testcase = %(check)s
-    RETURNING resultid;''', record)
-    resultid, = cur.fetchone()
-    return resultid
+      AND result2.scopeuuid = r.scopeuuid
+      AND result2.version = r.version
+      AND result2.testcase = r.testcase
+    RETURNING r.idx, result2.subject, result2.scopeuuid, result2.checked_at::date;''', arrays)
+    updated = [[] for _ in approvals]
+    for idx, subject, scopeuuid, day in cur.fetchall():
+        updated[idx - 1].append((subject, scopeuuid, day))
+    return [updated[positions[tuple(record[col] for col in columns)]] for record in records]
+
+
+def db_patch_approval_filtered2(
+    cur: cursor, approval,
+    reportuuid=None, subject=None, scopeuuid=None, version=None, testcase=None, result=None, before=None,
+):
+    """set approval for all results matching the given filter
+
+    Returns list of quadruples (subject, scopeuuid, day, count) of updated results.
+    """
+    cur.execute(sql.SQL('''
+    WITH updated AS (
+        UPDATE result2
+        SET approval = %(approval)s
+        FROM report
+        {filter_condition}
+        RETURNING result2.subject, result2.scopeuuid, result2.checked_at::date AS day
+    )
+    SELECT subject, scopeuuid, day, count(*)
+    FROM updated
+    GROUP BY subject, scopeuuid, day;''').format(
+        filter_condition=make_where_clause(
+            sql.SQL('result2.reportid = report.reportid'),
+            None if reportuuid is None else sql.SQL('report.reportuuid = %(reportuuid)s'),
+            None if subject is None else sql.SQL('result2.subject = %(subject)s'),
+            None if scopeuuid is None else sql.SQL('result2.scopeuuid = %(scopeuuid)s'),
+            None if version is None else sql.SQL('result2.version = %(version)s'),
+            None if testcase is None else sql.SQL('result2.testcase = %(testcase)s'),
+            None if result is None else sql.SQL('result2.result = %(result)s'),
+            None if before is None else sql.SQL('result2.checked_at < %(before)s'),
+        ),
+    ), {
+        "approval": approval, "reportuuid": reportuuid, "subject": subject, "scopeuuid": scopeuuid,
+        "version": version, "testcase": testcase, "result": result, "before": before,
+    })
+    return cur.fetchall()
+
+
+def db_update_rollup2(cur: cursor, subject, scopeuuid, day_results: dict):
+    """replace rollup of `subject` and `scopeuuid` for the days given by `day_results`
+
+    Here, `day_results` maps each day to a mapping from version to result.
+    """
+    if not day_results:
+        return
+    cur.execute('''
+    DELETE FROM rollup2
+    WHERE subject = %s AND scopeuuid = %s AND day = ANY(%s);''', (subject, scopeuuid, list(day_results)))
+    # the conflict can only arise if another process has updated the same rollup concurrently
+    execute_values(cur, '''
+    INSERT INTO rollup2 (day, subject, scopeuuid, version, result)
+    VALUES %s
+    ON CONFLICT (subject, scopeuuid, version, day) DO UPDATE SET result = EXCLUDED.result;''', [
+        (day, subject, scopeuuid, version, result)
+        for day, version_results in day_results.items()
+        for version, result in version_results.items()
+    ])
+
+
+def db_get_rollup_heads2(cur: cursor, subject=None, scopeuuid=None):
+    """list triples (subject, scopeuuid, day) giving the latest day of the rollup for each subject and scope"""
+    cur.execute(sql.SQL('''
+    SELECT subject, scopeuuid, max(day)
+    FROM rollup2
+    {filter_condition}
+    GROUP BY subject, scopeuuid;
+    ''').format(
+        filter_condition=make_where_clause(
+            None if subject is None else sql.SQL('subject = %(subject)s'),
+            None if scopeuuid is None else sql.SQL('scopeuuid = %(scopeuuid)s'),
+        ),
+    ), {"subject": subject, "scopeuuid": scopeuuid})
+    return cur.fetchall()
+
+
+def db_get_rollup2(cur: cursor, subject=None, scopeuuid=None, since=None, until=None):
+    """list daily rollup rows (day, subject, scopeuuid, version, result) with since <= day < until"""
+    cur.execute(sql.SQL('''
+    SELECT day, subject, scopeuuid, version, result
+    FROM rollup2
+    {filter_condition}
+    ORDER BY subject, scopeuuid, version, day;
+    ''').format(
+        filter_condition=make_where_clause(
+            None if subject is None else sql.SQL('subject = %(subject)s'),
+            None if scopeuuid is None else sql.SQL('scopeuuid = %(scopeuuid)s'),
+            None if since is None else sql.SQL('day >= %(since)s'),
+            None if until is None else sql.SQL('day < %(until)s'),
+        ),
+    ), {"subject": subject, "scopeuuid": scopeuuid, "since": since, "until": until})
+    return cur.fetchall()
+
+
+def db_notify(cur: cursor, channel, payload):
+    # notifications are transactional: they will be delivered upon commit (if any)
+    cur.execute('SELECT pg_notify(%s, %s);', (channel, payload))
+
+
+def db_insert_job(cur: cursor, subject, roles, content_type, payload):
+    cur.execute('''
+    INSERT INTO job (subject, roles, content_type, payload)
+    VALUES (%s, %s, %s, %s)
+    RETURNING jobid;''', (subject, roles, content_type, payload))
+    jobid, = cur.fetchone()
+    return jobid
+
+
+def db_claim_job(cur: cursor):
+    """lock the oldest queued job that is not locked yet, and return its data (or None if there is none)
+
+    The lock is held until the end of the transaction; if the transaction is rolled back, the job is
+    still queued, so it will be claimed again.
+    """
+    cur.execute('''
+    SELECT jobid, subject, roles, content_type, payload
+    FROM job
+    WHERE status = 'queued'
+    ORDER BY jobid
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED;''')
+    return cur.fetchone()
+
+
+def db_finish_job(cur: cursor, jobid, status, result, generation=None):
+    cur.execute('''
+    UPDATE job
+    SET status = %s, result = %s, generation = %s, finished_at = LOCALTIMESTAMP, payload = NULL
+    WHERE jobid = %s;''', (status, json.dumps(result), generation, jobid))
+
+
+def db_get_job(cur: cursor, jobid):
+    columns = ('jobid', 'status', 'created_at', 'finished_at', 'subject', 'result', 'generation')
+    cur.execute(sql.SQL("SELECT {} FROM job WHERE jobid = %s;").format(
+        sql.SQL(', ').join(sql.Identifier(col) for col in columns),
+    ), (jobid, ))
+    row = cur.fetchone()
+    return None if row is None else dict(zip(columns, row))